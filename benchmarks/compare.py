@@ -0,0 +1,37 @@
+from typing import Dict, List, Tuple
+
+from benchmarks.suite import Metrics
+
+
+def is_regression(
+    metric: str, value: float, baseline: float, tolerance: float
+) -> bool:
+    """Check if a metric got worse than the baseline by more than the
+    relative tolerance. Throughputs (`_per_second`) regress when they go
+    down, times when they go up."""
+    if metric.endswith("_per_second"):
+        return value < baseline * (1 - tolerance)
+    return value > baseline * (1 + tolerance)
+
+
+def compare_results(
+    results: Dict[str, Metrics],
+    baseline: Dict[str, Metrics],
+    tolerance: float,
+) -> Tuple[List[str], List[str]]:
+    """Compare the metrics present in both results and baseline. Return a
+    report line per metric and the names of the regressed metrics."""
+    report, regressions = [], []
+    for name in sorted(results.keys() & baseline.keys()):
+        for metric in sorted(results[name].keys() & baseline[name].keys()):
+            value, reference = results[name][metric], baseline[name][metric]
+            change = (value - reference) / reference if reference else 0.0
+            regressed = is_regression(metric, value, reference, tolerance)
+            report.append(
+                f"{'REGRESSION' if regressed else 'ok':<10} "
+                f"{name}.{metric}: {value:.3f} vs {reference:.3f} "
+                f"({change:+.1%})"
+            )
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+    return report, regressions
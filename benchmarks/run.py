@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from qdrant_client import QdrantClient
+
+from benchmarks.compare import compare_results
+from benchmarks.suite import (
+    bench_embeddings,
+    bench_model_load,
+    bench_payloads,
+    bench_vectordb,
+)
+from benchmarks.synthetic import create_audios, create_images
+from configuration.load import config
+from rag.core.metrics import metrics
+from rag.core.models import INFERENCE_BACKEND
+from rag.core.profiles import CollectionProfile
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ingest and search hot paths"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="benchmarks/results.json",
+        help="File where the results are written as JSON",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="Results of a previous run to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative change allowed before a metric is a regression",
+    )
+    parser.add_argument(
+        "--skip-models",
+        action="store_true",
+        help="Skip the benchmarks that need the CLAP and CLIP weights",
+    )
+    parser.add_argument(
+        "--on-disk",
+        action="store_true",
+        help="Use an embedded Qdrant in a temporary directory, not in RAM",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        default=config["vectordb"]["profile"],
+        help="Collection profile of the vector store benchmarks",
+        choices=list(config["vectordb"]["profiles"]),
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=32,
+        help="Number of synthetic audios and images",
+    )
+    parser.add_argument(
+        "--points",
+        type=int,
+        default=10000,
+        help="Number of points upserted to the vector store",
+    )
+    parser.add_argument(
+        "--queries",
+        type=int,
+        default=200,
+        help="Number of timed searches",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=20,
+        help="Number of timed single embeddings",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=config["ingest"]["batch_size"],
+        help="Number of items per batch",
+    )
+
+    args = parser.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        audio_paths = create_audios(
+            os.path.join(directory, "audio"), args.files
+        )
+        results.update(
+            bench_payloads([os.path.basename(path) for path in audio_paths])
+        )
+
+        if not args.skip_models:
+            image_paths = create_images(
+                os.path.join(directory, "images"), args.files
+            )
+            results.update(bench_model_load())
+            results.update(
+                bench_embeddings(
+                    audio_paths=audio_paths,
+                    image_paths=image_paths,
+                    repeats=args.repeats,
+                    batch_size=args.batch_size,
+                )
+            )
+
+        client = (
+            QdrantClient(path=os.path.join(directory, "qdrant"))
+            if args.on_disk
+            else QdrantClient(location=":memory:")
+        )
+        results.update(
+            bench_vectordb(
+                client=client,
+                profile=CollectionProfile.from_config(args.profile),
+                num_points=args.points,
+                num_queries=args.queries,
+                batch_size=args.batch_size,
+            )
+        )
+        client.close()
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "inference_backend": INFERENCE_BACKEND,
+            "args": vars(args),
+        },
+        "results": results,
+        "metrics": metrics.to_dict(),
+    }
+    with open(args.output, "w") as file:
+        json.dump(output, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        report, regressions = compare_results(
+            results, baseline, args.tolerance
+        )
+        print("\n".join(report))
+        if regressions:
+            print(f"{len(regressions)} metrics regressed: {regressions}")
+            sys.exit(1)
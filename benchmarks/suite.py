@@ -0,0 +1,214 @@
+import hashlib
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from configuration.load import config
+from rag.core.data import DataToUpsert, audio_payload_generator, batched
+from rag.core.models import (
+    MODEL_AUDIO_DIM,
+    Modalities,
+    create_embeddings_audio,
+    create_embeddings_image,
+    models,
+    to_vectors,
+)
+from rag.core.profiles import CollectionProfile
+from rag.core.vectordb import QdrantWrapper
+
+# Result of a benchmark: metric name to value. Metrics ending in
+# `_per_second` are better when higher, the rest (times) when lower.
+Metrics = Dict[str, float]
+
+
+def latency_metrics(seconds: List[float]) -> Metrics:
+    """Summarize a list of latencies as p50, p95 and p99 in ms."""
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        f"p{q}_ms": float(np.percentile(milliseconds, q))
+        for q in (50, 95, 99)
+    }
+
+
+def time_calls(function: Callable[[], object], repeats: int) -> List[float]:
+    """Call a function several times and return the time of each call."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def bench_model_load() -> Dict[str, Metrics]:
+    """Time loading the weights of CLAP and CLIP from the local cache."""
+    groups = {
+        "clap": ["audio", "audio_encoder"],
+        "clip": ["image", "image_processor", "tokenizer", "image_encoder"],
+    }
+    results = {}
+    for model_name, names in groups.items():
+        for name in names:
+            models.evict(name)
+        start = time.perf_counter()
+        models.warm_up(names)
+        results[f"model_load.{model_name}"] = {
+            "seconds": time.perf_counter() - start
+        }
+    return results
+
+
+def bench_embeddings(
+    audio_paths: List[str],
+    image_paths: List[str],
+    repeats: int,
+    batch_size: int,
+) -> Dict[str, Metrics]:
+    """Time single and batched embeddings of CLAP and CLIP, for text and
+    files. The models are loaded before timing."""
+    cases = {
+        "clap.text": (
+            create_embeddings_audio,
+            Modalities.TEXT,
+            "texts_list",
+            ["a dog barking"] * batch_size,
+        ),
+        "clap.audio": (
+            create_embeddings_audio,
+            Modalities.AUDIO,
+            "audio_paths",
+            audio_paths[:batch_size],
+        ),
+        "clip.text": (
+            create_embeddings_image,
+            Modalities.TEXT,
+            "texts_list",
+            ["a photo of a dog"] * batch_size,
+        ),
+        "clip.image": (
+            create_embeddings_image,
+            Modalities.IMAGE,
+            "image_paths",
+            image_paths[:batch_size],
+        ),
+    }
+
+    results = {}
+    for name, (function, modality, argument, values) in cases.items():
+        function(modality=modality, **{argument: values[:1]})
+        single = time_calls(
+            lambda: function(modality=modality, **{argument: values[:1]}),
+            repeats,
+        )
+        results[f"embed.{name}.single"] = latency_metrics(single)
+
+        batch = time_calls(
+            lambda: function(
+                modality=modality, batch=True, **{argument: values}
+            ),
+            max(repeats // 4, 1),
+        )
+        results[f"embed.{name}.batch"] = {
+            "items_per_second": len(values) / float(np.median(batch))
+        }
+    return results
+
+
+def bench_payloads(filenames: List[str]) -> Dict[str, Metrics]:
+    """Time the payload generation of the audios, metadata included."""
+    audio_payload_generator(filenames[0])
+    start = time.perf_counter()
+    for filename in filenames:
+        audio_payload_generator(filename)
+    seconds = time.perf_counter() - start
+    return {"payloads.audio": {"items_per_second": len(filenames) / seconds}}
+
+
+def _random_embedding_function(dim: int, seed: int = 0) -> Callable:
+    """Embedding function with the interface of the real ones that returns
+    random vectors, so the vector store is measured without the models."""
+    rng = np.random.default_rng(seed)
+
+    def embed(modality: Modalities, batch: bool = False, **inputs):
+        values = next(value for value in inputs.values() if value)
+        embeddings = to_vectors(rng.standard_normal((len(values), dim)))
+        return embeddings if batch else embeddings[0]
+
+    return embed
+
+
+def bench_vectordb(
+    client: QdrantClient,
+    profile: CollectionProfile,
+    num_points: int,
+    num_queries: int,
+    batch_size: int,
+    seed: int = 0,
+) -> Dict[str, Metrics]:
+    """Time the upsert throughput and the search latency of `QdrantWrapper`
+    on random vectors with the dimension of CLAP, with and without a
+    payload filter."""
+    embedding_function = _random_embedding_function(MODEL_AUDIO_DIM, seed)
+    qdrant_manager = QdrantWrapper(
+        client=client,
+        embedding_function_audios=embedding_function,
+        embedding_function_images=embedding_function,
+        profile=profile,
+    )
+    collection_name = config["vectordb"]["collection_audio"]
+    if qdrant_manager.check_collection(collection_name):
+        qdrant_manager.delete_collection(collection_name)
+    qdrant_manager.create_collection(
+        collection_name=collection_name,
+        vectors_config=profile.vectors_config(size=MODEL_AUDIO_DIM),
+    )
+
+    rng = np.random.default_rng(seed)
+    categories = [f"category_{i}" for i in range(10)]
+    data = [
+        DataToUpsert(
+            value=f"audio_{i}.wav",
+            payload={
+                "category": categories[i % len(categories)],
+                "type": "sound",
+                "filename": f"audio_{i}.wav",
+            },
+            digest=hashlib.sha256(str(i).encode()).hexdigest(),
+        )
+        for i in range(num_points)
+    ]
+    embeddings = to_vectors(rng.standard_normal((num_points, MODEL_AUDIO_DIM)))
+
+    start = time.perf_counter()
+    for batch, batch_embeddings in zip(
+        batched(data, batch_size), batched(embeddings, batch_size)
+    ):
+        qdrant_manager.upsert_points(
+            collection_name=collection_name,
+            data=batch,
+            embeddings=batch_embeddings,
+        )
+    upsert_seconds = time.perf_counter() - start
+    # Every point must have its own id, or the upserts overwrite each other
+    count = client.count(collection_name=collection_name, exact=True).count
+    assert count == num_points, f"Upserted {count} of {num_points} points"
+
+    def search(filters=None) -> List[float]:
+        return time_calls(
+            lambda: qdrant_manager.search_vectors(
+                collection_name=collection_name,
+                value="a dog barking",
+                filters=filters,
+            ),
+            num_queries,
+        )
+
+    return {
+        "vectordb.upsert": {"items_per_second": num_points / upsert_seconds},
+        "vectordb.search": latency_metrics(search()),
+        "vectordb.search_filtered": latency_metrics(
+            search({"category": categories[0]})
+        ),
+    }
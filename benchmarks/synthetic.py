@@ -0,0 +1,55 @@
+import os
+from typing import List
+
+import numpy as np
+
+from configuration.load import config
+
+
+def create_images(
+    directory: str, num_images: int, size: int = 224, seed: int = 0
+) -> List[str]:
+    """Write random RGB images and return their paths."""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(num_images):
+        path = os.path.join(
+            directory, f"image_{i}{config['local']['image_file_extension']}"
+        )
+        pixels = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path)
+        paths.append(path)
+    return paths
+
+
+def create_audios(
+    directory: str,
+    num_audios: int,
+    seconds: float = config["msclap"]["duration"],
+    sampling_rate: int = config["msclap"]["sampling_rate"],
+    seed: int = 0,
+) -> List[str]:
+    """Write random 16-bit PCM WAV files, a tone with noise, and return
+    their paths."""
+    from scipy.io import wavfile
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    time = np.arange(int(seconds * sampling_rate)) / sampling_rate
+    paths = []
+    for i in range(num_audios):
+        path = os.path.join(
+            directory, f"audio_{i}{config['local']['audio_file_extension']}"
+        )
+        waveform = 0.5 * np.sin(2 * np.pi * rng.uniform(100, 2000) * time)
+        waveform += 0.1 * rng.standard_normal(time.shape[0])
+        wavfile.write(
+            path,
+            sampling_rate,
+            (np.clip(waveform, -1, 1) * 32767).astype(np.int16),
+        )
+        paths.append(path)
+    return paths
@@ -1,42 +1,224 @@
-from typing import Optional, Generator
-import boto3
+import argparse
+import hashlib
 import os
-from datasets import load_dataset
-from configuration.load import config
 import pathlib
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Generator, Iterable, Optional
+
+from configuration.load import config
 
-s3 = boto3.client("s3")
 BUCKET = config["s3"]["bucket"]
 S3_PATH = config["s3"]["path"]
 
 LOCAL_PATH_AUDIOS = config["local"]["audios"]
 
+# Size of the chunks streamed from S3 to disk
+CHUNK_SIZE = 1024 * 1024
+
+
+def create_s3_client(
+    endpoint_url: Optional[str] = config["s3"]["endpoint_url"],
+):
+    """Create the S3 client. An endpoint URL points it to an S3-compatible
+    service, such as a local moto server."""
+    import boto3
+
+    return boto3.client("s3", endpoint_url=endpoint_url)
+
+
+def run_bounded(
+    function: Callable[..., Any],
+    items: Iterable[tuple],
+    num_workers: int,
+) -> Generator[Any, None, None]:
+    """Call `function` with the arguments of each item in a pool of threads
+    and yield the results as they complete. At most twice `num_workers`
+    items are pending at a time, so large listings and datasets are not
+    loaded in memory at once."""
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(function, *item))
+            if len(pending) >= 2 * num_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def search_audios(
+    s3, category: Optional[str] = None
+) -> Generator[Dict[str, Any], None, None]:
+    """Search for audio files in the specified category, following every
+    page of the listing. Yields the key, size and ETag of each object."""
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=S3_PATH):
+        for content in page.get("Contents", []):
+            if category is None or category in content["Key"]:
+                yield content
+
 
-def search_audios(category: Optional[str] = None) -> Generator:
-    """Search for audio files in the specified category."""
-    response = s3.list_objects_v2(Bucket=BUCKET, Prefix=S3_PATH)
-    contents = response.get("Contents", [])
-    for content in contents:
-        key = content["Key"]
-        if category is None or category in key:
-            yield key
+def _md5(path: str) -> str:
+    """Compute the MD5 hex digest of a file."""
+    digest = hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def download_audios_from_s3(category: Optional[str] = None) -> None:
-    """Download all audio files from the specified category."""
-    audios = search_audios(category)
+def is_downloaded(
+    path: str, size: int, etag: str, verify_etag: bool = False
+) -> bool:
+    """Check if a file matches the size of the object, and its ETag if
+    `verify_etag` is True. The ETag of multipart uploads is not an MD5, so
+    only the size is checked for them."""
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        return False
+    etag = etag.strip('"')
+    if verify_etag and "-" not in etag:
+        return _md5(path) == etag
+    return True
+
+
+def _read_etag(path: str) -> Optional[str]:
+    """Read the ETag stored next to a partial download, if any."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return file.read().strip() or None
+
+
+def _write_body(response: Dict[str, Any], path: str, mode: str) -> None:
+    """Stream the body of a response of S3 to a file."""
+    with open(path, mode) as file:
+        for chunk in response["Body"].iter_chunks(CHUNK_SIZE):
+            file.write(chunk)
+
+
+def download_object(
+    s3, content: Dict[str, Any], target_dir: str, verify_etag: bool = False
+) -> str:
+    """Download an object unless it is already present. The data is written
+    to a `.part` file that is renamed when complete, and the ETag of the
+    object it comes from is stored next to it in a `.part.etag` file. An
+    interrupted download is resumed from where it stopped only if the
+    object still has that ETag, otherwise it starts over. Return the
+    status: skipped, downloaded or resumed."""
+    from botocore.exceptions import ClientError
+
+    key, size, etag = content["Key"], content["Size"], content["ETag"]
+    path = os.path.join(target_dir, pathlib.Path(key).name)
+    if is_downloaded(path, size, etag, verify_etag):
+        return "skipped"
+
+    part_path = f"{path}.part"
+    etag_path = f"{part_path}.etag"
+    part_etag = _read_etag(etag_path)
+    offset = 0
+    # Partial downloads of another version of the object are discarded
+    if part_etag == etag and os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+
+    status = "downloaded"
+    if offset == size and is_downloaded(part_path, size, etag, verify_etag):
+        status = "resumed"
+    elif 0 < offset < size:
+        try:
+            response = s3.get_object(
+                Bucket=BUCKET,
+                Key=key,
+                IfMatch=part_etag,
+                Range=f"bytes={offset}-",
+            )
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in ("PreconditionFailed", "412"):
+                raise
+            # The object changed since the listing, start over
+        else:
+            _write_body(response, part_path, "ab")
+            status = "resumed"
 
-    for audio in audios:
-        s3.download_file(
-            BUCKET,
-            audio,
-            f"{LOCAL_PATH_AUDIOS}/{pathlib.Path(audio).name}",
+    if status == "downloaded":
+        response = s3.get_object(Bucket=BUCKET, Key=key)
+        # The ETag is stored before the data, so a `.part` file is never
+        # resumed from another version of the object
+        with open(etag_path, "w") as file:
+            file.write(response["ETag"])
+        _write_body(response, part_path, "wb")
+
+    os.replace(part_path, path)
+    os.remove(etag_path)
+    return status
+
+
+def download_audios_from_s3(
+    category: Optional[str] = None,
+    s3=None,
+    num_workers: int = config["download"]["workers"],
+    verify_etag: bool = False,
+) -> Dict[str, int]:
+    """Download all audio files from the specified category, several at a
+    time. Return the number of files by status."""
+    s3 = s3 or create_s3_client()
+    os.makedirs(LOCAL_PATH_AUDIOS, exist_ok=True)
+
+    statuses = Counter(
+        run_bounded(
+            download_object,
+            (
+                (s3, content, LOCAL_PATH_AUDIOS, verify_etag)
+                for content in search_audios(s3, category)
+            ),
+            num_workers=num_workers,
         )
+    )
+    print(f"Audios from S3: {dict(statuses)}")
+    return dict(statuses)
+
+
+def _save_image(image, path: str) -> str:
+    """Save an image unless it is already present, through a `.part` file
+    so interrupted writes are not mistaken for saved images."""
+    if os.path.exists(path):
+        return "skipped"
+    part_path = f"{path}.part"
+    image.save(part_path, format=pathlib.Path(path).suffix[1:].upper())
+    os.replace(part_path, path)
+    return "downloaded"
+
+
+def _save_audio(audio_array, sampling_rate: int, path: str) -> str:
+    """Save an audio as a WAV file unless it is already present."""
+    from scipy.io.wavfile import write
+
+    if os.path.exists(path):
+        return "skipped"
+    part_path = f"{path}.part"
+    write(part_path, sampling_rate, audio_array)
+    os.replace(part_path, path)
+    return "downloaded"
+
 
+def _save_safely(save: Callable[..., str], index: int, *args) -> str:
+    """Save an example, reporting errors instead of stopping the others."""
+    try:
+        return save(*args)
+    except Exception as e:
+        print(f"Error saving example {index}: {e}")
+        return "failed"
 
-def download_images() -> None:
+
+def download_images(
+    num_workers: int = config["download"]["workers"],
+) -> Dict[str, int]:
     """Download the dataset of the images
-    from HuggingFace and save as image files."""
+    from HuggingFace and save as image files, several at a time."""
+    from datasets import load_dataset
+
     # Load the dataset from HuggingFace
     dataset = load_dataset(config["huggingface"]["images_dataset_path"])
 
@@ -45,19 +227,32 @@ def download_images() -> None:
     os.makedirs(target_dir, exist_ok=True)
 
     # Save each image to the target directory
-    for i, example in enumerate(dataset["train"]):
-        try:
-            print(f"Saving image {i}")
-            image = example["image"]
-            image.save(os.path.join(target_dir, f"image_{i}.png"))
-        except Exception as e:
-            print(f"Error saving image {i}: {e}")
-            pass
+    extension = config["local"]["image_file_extension"]
+    statuses = Counter(
+        run_bounded(
+            _save_safely,
+            (
+                (
+                    _save_image,
+                    i,
+                    example["image"],
+                    os.path.join(target_dir, f"image_{i}{extension}"),
+                )
+                for i, example in enumerate(dataset["train"])
+            ),
+            num_workers=num_workers,
+        )
+    )
+    print(f"Images from HuggingFace: {dict(statuses)}")
+    return dict(statuses)
 
 
-def download_audios() -> None:
-    """Download all audio files from the specified dataset from HuggingFace."""
-    from scipy.io.wavfile import write
+def download_audios(
+    num_workers: int = config["download"]["workers"],
+) -> Dict[str, int]:
+    """Download all audio files from the specified dataset from HuggingFace,
+    several at a time."""
+    from datasets import load_dataset
 
     # Load the dataset from HuggingFace
     dataset = load_dataset(config["huggingface"]["audios_dataset_path"])
@@ -67,28 +262,69 @@ def download_audios() -> None:
     os.makedirs(target_dir, exist_ok=True)
 
     # Save each audio to the target directory
-    for i, example in enumerate(dataset["test"]):
-        try:
-            print(f"Saving audio {i}")
-            audio = example["audio"]
-            audio_array = audio["array"]
-            sampling_rate = audio["sampling_rate"]
-
-            # Convert the array to an audio object
-            write(
-                os.path.join(target_dir, f"audio_{i}.wav"),
-                sampling_rate,
-                audio_array,
-            )
-            break
-        except Exception as e:
-            print(f"Error saving audio {i}: {e}")
-            pass
+    statuses = Counter(
+        run_bounded(
+            _save_safely,
+            (
+                (
+                    _save_audio,
+                    i,
+                    example["audio"]["array"],
+                    example["audio"]["sampling_rate"],
+                    os.path.join(target_dir, f"audio_{i}.wav"),
+                )
+                for i, example in enumerate(dataset["test"])
+            ),
+            num_workers=num_workers,
+        )
+    )
+    print(f"Audios from HuggingFace: {dict(statuses)}")
+    return dict(statuses)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the datasets")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=config["download"]["workers"],
+        help="Number of files transferred or saved at the same time",
+    )
+    parser.add_argument(
+        "-c",
+        "--category",
+        type=str,
+        default=None,
+        help="Only download the audios whose key contains this category",
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        default=config["s3"]["endpoint_url"],
+        help="S3-compatible endpoint, e.g. a local moto server",
+    )
+    parser.add_argument(
+        "--verify-etag",
+        action="store_true",
+        help="Compare the MD5 of present files with the ETag of S3",
+    )
+    parser.add_argument(
+        "--skip-images",
+        action="store_true",
+        help="Do not download the images from HuggingFace",
+    )
+
+    args = parser.parse_args()
+
     # Download all audio files from S3 bucket
-    download_audios_from_s3()
+    download_audios_from_s3(
+        category=args.category,
+        s3=create_s3_client(args.endpoint_url),
+        num_workers=args.workers,
+        verify_etag=args.verify_etag,
+    )
 
     # Download the images from the HuggingFace dataset
-    download_images()
+    if not args.skip_images:
+        download_images(num_workers=args.workers)
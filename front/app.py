@@ -1,10 +1,30 @@
 import streamlit as st
 from configuration.load import config
-from rag.clients import qdrant_manager
-from rag import search_similar_items
-from rag.core.models import create_caption, Modalities
+from rag import (
+    search_cross_modal,
+    search_similar_items,
+    search_similar_items_many,
+)
+from rag.core.connection import wait_until_ready
+from rag.core.models import Modalities, warm_up_caption_models
 import time
 
+
+@st.cache_resource
+def load_clients():
+    """Create the Qdrant clients and the search engines once per process,
+    so every session shares their connections, after Qdrant is ready."""
+    from rag import clients
+
+    wait_until_ready(clients.client)
+    return (
+        clients.qdrant_manager,
+        clients.async_qdrant_manager,
+        clients.hybrid_retriever,
+        clients.zero_shot_labeler,
+    )
+
+
 # Custom theme
 st.set_page_config(
     page_title="Multimodal Animal Retrieval",
@@ -17,6 +37,17 @@ st.set_page_config(
     },
 )
 
+(
+    qdrant_manager,
+    async_qdrant_manager,
+    hybrid_retriever,
+    zero_shot_labeler,
+) = load_clients()
+
+# Load the captioning models once per process, before the first search
+if config["captions"]["warm_up"]:
+    warm_up_caption_models()
+
 # Custom CSS
 st.markdown(
     """
@@ -50,7 +81,7 @@ st.sidebar.markdown(
 )
 
 
-def display_results(results, result_type):
+def display_results(results, result_type, score_name="Similarity"):
     if not results:
         st.warning("No results found.")
         return
@@ -62,14 +93,20 @@ def display_results(results, result_type):
             st.markdown(f"**Result {i+1}**")
             if result_type == "audio":
                 st.audio(
-                    "data/audio/" + result.payload["filename"], start_time=0
+                    "data/audio/" + result.payload["filename"],
+                    start_time=int(result.payload.get("start", 0)),
                 )
             elif result_type == "image":
                 st.image(
                     "data/images/" + result.payload["filename"], width=400
                 )
-            st.write(f"Similarity: {result.score:.4f}")
+            st.write(f"{score_name}: {result.score:.4f}")
             st.write(f"Filename: {result.payload['filename']}")
+            if "start" in result.payload:
+                st.write(
+                    f"Segment: {result.payload['start']:.1f}s - "
+                    f"{result.payload['end']:.1f}s"
+                )
             st.markdown("---")
 
 
@@ -88,15 +125,12 @@ with tab1:
                 time.sleep(0.01)
                 progress_bar.progress(i + 1)
             with st.spinner("Searching..."):
-                results_audio = search_similar_items(
-                    qdrant_manager=qdrant_manager,
-                    collection_name=config["vectordb"]["collection_audio"],
-                    value=text_query,
-                )
-                results_images = search_similar_items(
-                    qdrant_manager=qdrant_manager,
-                    collection_name=config["vectordb"]["collection_image"],
-                    value=text_query,
+                results_audio, results_images = search_similar_items_many(
+                    async_qdrant_manager=async_qdrant_manager,
+                    queries=[
+                        (config["vectordb"]["collection_audio"], text_query),
+                        (config["vectordb"]["collection_image"], text_query),
+                    ],
                 )
                 display_results(results_audio, "audio")
                 display_results(results_images, "image")
@@ -126,15 +160,14 @@ with tab2:
                 display_results(results, "audio")
 
             with st.spinner("Retrieving images..."):
-                caption = create_caption(
-                    modality=Modalities.AUDIO, path=audio_path
-                )
-                results_images = search_similar_items(
+                results_images = search_cross_modal(
                     qdrant_manager=qdrant_manager,
-                    collection_name=config["vectordb"]["collection_image"],
-                    value=caption,
+                    retriever=hybrid_retriever,
+                    labeler=zero_shot_labeler,
+                    modality=Modalities.AUDIO,
+                    path=audio_path,
                 )
-                display_results(results_images, "image")
+                display_results(results_images, "image", "Fused score")
         else:
             st.warning("Please upload an audio file.")
 
@@ -161,15 +194,14 @@ with tab3:
                 display_results(results, "image")
 
             with st.spinner("Retrieving audios..."):
-                caption = create_caption(
-                    modality=Modalities.IMAGE, path=image_path
-                )
-                result_audio = search_similar_items(
+                result_audio = search_cross_modal(
                     qdrant_manager=qdrant_manager,
-                    collection_name=config["vectordb"]["collection_audio"],
-                    value=caption,
+                    retriever=hybrid_retriever,
+                    labeler=zero_shot_labeler,
+                    modality=Modalities.IMAGE,
+                    path=image_path,
                 )
-                display_results(result_audio, "audio")
+                display_results(result_audio, "audio", "Fused score")
         else:
             st.warning("Please upload an image file.")
 
@@ -1,7 +1,23 @@
-from rag.rag import create_collections, search_similar_items, upsert_full_data
+from rag.rag import (
+    create_collections,
+    create_multimodal_collection,
+    search_cross_modal,
+    search_similar_items,
+    search_similar_items_batch,
+    search_similar_items_many,
+    search_similar_items_multimodal,
+    sync_full_data,
+    upsert_full_data,
+)
 
 __all__ = [
     "upsert_full_data",
+    "sync_full_data",
     "search_similar_items",
+    "search_similar_items_batch",
+    "search_similar_items_many",
+    "search_similar_items_multimodal",
+    "search_cross_modal",
     "create_collections",
+    "create_multimodal_collection",
 ]
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+
+from configuration.load import config
+from rag.core.models import check_inference_backend
+
+
+def list_files(directory: str, file_extension: str, limit: int):
+    """List the first files with the given extension in a directory."""
+    files = sorted(
+        f for f in os.listdir(directory) if f.endswith(file_extension)
+    )
+    return [os.path.join(directory, f) for f in files[:limit]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the configured inference backend with fp32"
+    )
+    parser.add_argument(
+        "-a",
+        "--audios",
+        type=str,
+        default=config["local"]["audios"],
+        help="Directory with the audios used for the check",
+    )
+    parser.add_argument(
+        "-i",
+        "--images",
+        type=str,
+        default=config["local"]["images"],
+        help="Directory with the images used for the check",
+    )
+    parser.add_argument(
+        "-t",
+        "--texts",
+        type=str,
+        nargs="*",
+        default=["a dog barking", "a cat meowing", "birds chirping"],
+        help="Text queries used for the check",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=16,
+        help="Maximum number of files of each modality",
+    )
+
+    args = parser.parse_args()
+    report = check_inference_backend(
+        audio_paths=list_files(
+            args.audios, config["local"]["audio_file_extension"], args.limit
+        ),
+        image_paths=list_files(
+            args.images, config["local"]["image_file_extension"], args.limit
+        ),
+        texts=args.texts,
+    )
+    print(json.dumps(report, indent=2))
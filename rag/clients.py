@@ -1,15 +1,122 @@
-from qdrant_client import QdrantClient
+from functools import lru_cache
+from typing import Optional
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
 
 from configuration.load import config
-from rag.core.models import create_embeddings_audio, create_embeddings_image
-from rag.core.vectordb import QdrantWrapper
+from rag.core.batching import EmbeddingService
+from rag.core.cache import QueryEmbeddingCache
+from rag.core.connection import ConnectionSettings, RetryingClient
+from rag.core.data import get_audio_categories
+from rag.core.models import (
+    Model,
+    create_embeddings_audio,
+    create_embeddings_image,
+)
+from rag.core.profiles import CollectionProfile
+from rag.core.retrieval import HybridRetriever, ZeroShotLabeler
+from rag.core.vectordb import AsyncQdrantWrapper, QdrantWrapper
+
+
+def create_client(
+    backend: str = config["vectordb"]["backend"],
+    settings: Optional[ConnectionSettings] = None,
+) -> QdrantClient:
+    """Create the Qdrant client for the given backend: `server` talks to a
+    Qdrant server, over gRPC if `vectordb.prefer_grpc` is set, while
+    `local` runs Qdrant's embedded engine in this process, persisted in
+    `vectordb.local_path` (":memory:" keeps it in RAM only). The client of
+    the server uses the pool, timeout and retries of
+    `vectordb.connection`."""
+    if backend == "server":
+        settings = settings or ConnectionSettings.from_config()
+        return RetryingClient(
+            QdrantClient(
+                url=config["vectordb"]["client"],
+                prefer_grpc=config["vectordb"]["prefer_grpc"],
+                grpc_port=config["vectordb"]["grpc_port"],
+                **settings.client_options(),
+            ),
+            settings=settings,
+        )
+    elif backend == "local":
+        local_path = config["vectordb"]["local_path"]
+        if local_path == ":memory:":
+            return QdrantClient(location=":memory:")
+        return QdrantClient(path=local_path)
+    else:
+        raise ValueError(f"Unsupported vector store backend: {backend}")
+
+
+def create_async_client(
+    backend: str = config["vectordb"]["backend"],
+    settings: Optional[ConnectionSettings] = None,
+) -> Optional[AsyncQdrantClient]:
+    """Create the async Qdrant client of the server, with the same
+    transport settings as the sync one. The embedded engine keeps its
+    storage locked by the sync client, so there is none for the local
+    backend."""
+    if backend != "server":
+        return None
+    settings = settings or ConnectionSettings.from_config()
+    return RetryingClient(
+        AsyncQdrantClient(
+            url=config["vectordb"]["client"],
+            prefer_grpc=config["vectordb"]["prefer_grpc"],
+            grpc_port=config["vectordb"]["grpc_port"],
+            **settings.client_options(),
+        ),
+        settings=settings,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_client(backend: str = config["vectordb"]["backend"]) -> QdrantClient:
+    """Get the Qdrant client of the process for a backend, created on first
+    use, so every caller shares its pool of connections."""
+    return create_client(backend)
+
 
 # Instantiate the Qdrant client
-client = QdrantClient(url=config["vectordb"]["client"])
+client = get_client()
+
+# Instantiate the service that micro-batches concurrent query embeddings
+embedding_service = None
+if config["search"]["batching"]["enabled"]:
+    embedding_service = EmbeddingService(
+        embedding_function_audios=create_embeddings_audio,
+        embedding_function_images=create_embeddings_image,
+        max_batch_size=config["search"]["batching"]["max_batch_size"],
+        max_wait_ms=config["search"]["batching"]["max_wait_ms"],
+    )
 
 # Instantiate the QdrantManager
 qdrant_manager = QdrantWrapper(
     client=client,
     embedding_function_audios=create_embeddings_audio,
     embedding_function_images=create_embeddings_image,
+    query_cache=QueryEmbeddingCache(
+        max_size=config["search"]["query_cache"]["max_size"],
+        ttl_seconds=config["search"]["query_cache"]["ttl_seconds"],
+    ),
+    embedding_service=embedding_service,
+    profile=CollectionProfile.from_config(),
+)
+
+# Instantiate the async QdrantManager, used to search several collections
+# concurrently. With the local backend the searches run in worker threads.
+async_qdrant_manager = AsyncQdrantWrapper(
+    client=create_async_client(), qdrant_manager=qdrant_manager
+)
+
+# Instantiate the engine of the cross-modal searches, with the categories
+# of the audios as the labels of the zero-shot stage
+hybrid_retriever = HybridRetriever()
+zero_shot_labeler = ZeroShotLabeler(
+    qdrant_manager=qdrant_manager,
+    get_labels=get_audio_categories,
+    prompts={
+        Model.CLAP: config["retrieval"]["prompts"]["audio"],
+        Model.CLIP: config["retrieval"]["prompts"]["image"],
+    },
 )
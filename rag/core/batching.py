@@ -0,0 +1,125 @@
+import time
+from concurrent.futures import Future
+from logging import Logger
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from rag.core.logger import logger
+from rag.core.models import Modalities, Model
+
+# Name of the argument of the embedding functions for each modality
+_MODALITY_ARGUMENTS = {
+    Modalities.AUDIO: "audio_paths",
+    Modalities.IMAGE: "image_paths",
+    Modalities.TEXT: "texts_list",
+}
+
+
+class MicroBatcher:
+    """
+    Collects the values submitted concurrently by several threads and runs
+    them through `batch_function` as a single batch. A batch is closed when
+    it reaches `max_batch_size` values or `max_wait_ms` after its first
+    value arrived, whichever happens first.
+    """
+
+    def __init__(
+        self,
+        batch_function: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "batcher",
+        logger: Logger = logger,
+    ):
+        self._batch_function = batch_function
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._logger = logger
+        self._queue: Queue = Queue()
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, value: Any) -> Future:
+        """Submit a value and get a future with its result."""
+        future: Future = Future()
+        self._queue.put((value, future))
+        return future
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        """Wait for a value and collect the ones arriving right after it."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            values = [value for value, _ in batch]
+            try:
+                results = self._batch_function(values)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self._logger.debug("Processed a batch of %d values", len(batch))
+
+
+class EmbeddingService:
+    """
+    Local embedding service that serves single-value requests with one
+    micro-batched forward pass per model and modality, so concurrent
+    queries share the model instead of competing for the CPU.
+    """
+
+    def __init__(
+        self,
+        embedding_function_audios: Callable,
+        embedding_function_images: Callable,
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        self._embedding_functions = {
+            Model.CLAP: embedding_function_audios,
+            Model.CLIP: embedding_function_images,
+        }
+        self._max_batch_size = max_batch_size
+        self._max_wait_ms = max_wait_ms
+        self._batchers: Dict[Tuple[Model, Modalities], MicroBatcher] = {}
+        self._lock = Lock()
+
+    def _batcher(self, model: Model, modality: Modalities) -> MicroBatcher:
+        """Get the batcher of a model and modality, creating it on first
+        use."""
+        with self._lock:
+            if (model, modality) not in self._batchers:
+                embedding_function = self._embedding_functions[model]
+                argument = _MODALITY_ARGUMENTS[modality]
+                self._batchers[model, modality] = MicroBatcher(
+                    batch_function=lambda values: embedding_function(
+                        modality=modality, batch=True, **{argument: values}
+                    ),
+                    max_batch_size=self._max_batch_size,
+                    max_wait_ms=self._max_wait_ms,
+                    name=f"{model.value}-{modality.value}-batcher",
+                )
+            return self._batchers[model, modality]
+
+    def embed(
+        self, model: Model, modality: Modalities, value: str
+    ) -> np.ndarray:
+        """Embed a single value, batched with concurrent requests."""
+        return self._batcher(model, modality).submit(value).result()
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Size of the chunks read from disk when hashing files
+_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """Compute the SHA-256 digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segment_digest(
+    digest: str, index: int, window_seconds: float, hop_seconds: float
+) -> str:
+    """Derive the digest of a segment of a file from the file digest, the
+    window and hop of the segmentation and the position of the segment, so
+    segments of different segmentations do not share ids."""
+    return hashlib.sha256(
+        f"{digest}:{window_seconds}:{hop_seconds}:{index}".encode()
+    ).hexdigest()
+
+
+def point_id_from_digest(digest: str) -> str:
+    """Derive a deterministic Qdrant point id from a content digest, so
+    re-ingesting the same file overwrites its point instead of adding a
+    duplicate."""
+    return str(uuid.UUID(digest[:32]))
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings stored in SQLite, keyed by the digest
+    of the file content and the id of the model that produced them. The
+    captions of the files are stored in the same database, keyed in the
+    same way by the captioning models.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    digest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (digest, model)
+                )"""
+            )
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS captions (
+                    digest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    caption TEXT NOT NULL,
+                    PRIMARY KEY (digest, model)
+                )"""
+            )
+
+    def get_many(
+        self, model_id: str, digests: Iterable[str]
+    ) -> Dict[str, np.ndarray]:
+        """Get the cached embeddings of the given digests, as float32 arrays
+        read directly from the stored bytes. Digests that are not in the
+        cache are missing from the result."""
+        digests = list(set(digests))
+        if not digests:
+            return {}
+
+        placeholders = ",".join("?" * len(digests))
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT digest, vector FROM embeddings "
+                f"WHERE model = ? AND digest IN ({placeholders})",
+                [model_id, *digests],
+            ).fetchall()
+
+        return {
+            digest: np.frombuffer(vector, dtype=np.float32)
+            for digest, vector in rows
+        }
+
+    def put_many(
+        self, model_id: str, embeddings: Dict[str, np.ndarray]
+    ) -> None:
+        """Store the embeddings of the given digests."""
+        rows = [
+            (digest, model_id, np.asarray(vector, dtype=np.float32).tobytes())
+            for digest, vector in embeddings.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (digest, model, vector) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def get_captions(
+        self, model_id: str, digests: Iterable[str]
+    ) -> Dict[str, str]:
+        """Get the cached captions of the given digests. Digests that are
+        not in the cache are missing from the result."""
+        digests = list(set(digests))
+        if not digests:
+            return {}
+
+        placeholders = ",".join("?" * len(digests))
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT digest, caption FROM captions "
+                f"WHERE model = ? AND digest IN ({placeholders})",
+                [model_id, *digests],
+            ).fetchall()
+        return dict(rows)
+
+    def put_captions(self, model_id: str, captions: Dict[str, str]) -> None:
+        """Store the captions of the given digests."""
+        rows = [
+            (digest, model_id, caption) for digest, caption in captions.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO captions (digest, model, caption) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def close(self) -> None:
+        """Close the connection to the cache."""
+        with self._lock:
+            self._connection.close()
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe in-memory LRU cache of query embeddings, keyed by the model
+    and the normalized query text. Entries expire after `ttl_seconds`, if
+    given, and the least recently used entry is evicted when the cache is
+    full.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model: Hashable, text: str) -> Tuple[Hashable, str]:
+        """Normalize the whitespace of the text so trivially different
+        queries share an entry. The case is kept since the CLAP text encoder
+        is case sensitive."""
+        return model, " ".join(text.split())
+
+    def get(self, model: Hashable, text: str) -> Optional[np.ndarray]:
+        """Get the cached embedding of a query, if present and fresh."""
+        key = self._key(model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                self._ttl_seconds is None
+                or time.monotonic() - entry[1] < self._ttl_seconds
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: Hashable, text: str, embedding: np.ndarray):
+        """Store the embedding of a query."""
+        key = self._key(model, text)
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the hit and miss counts of the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
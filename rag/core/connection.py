@@ -0,0 +1,206 @@
+import asyncio
+import inspect
+import random
+import time
+from dataclasses import dataclass
+from functools import wraps
+from logging import Logger
+from typing import Any, Callable, Dict
+
+from qdrant_client.http.exceptions import (
+    ResponseHandlingException,
+    UnexpectedResponse,
+)
+
+from configuration.load import config
+from rag.core.logger import logger
+from rag.core.metrics import metrics
+
+# HTTP statuses of the errors that may succeed if the request is repeated
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+# gRPC status codes of the errors that may succeed if the call is repeated
+TRANSIENT_GRPC_CODES = (
+    "UNAVAILABLE",
+    "DEADLINE_EXCEEDED",
+    "RESOURCE_EXHAUSTED",
+)
+
+retried_calls = metrics.counter(
+    "rag_qdrant_retries_total", "Calls to Qdrant repeated after an error"
+)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Check if an error of the Qdrant client is worth retrying: connection
+    errors, overloaded or restarting servers and timeouts."""
+    if isinstance(error, (ResponseHandlingException, ConnectionError)):
+        return True
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code in TRANSIENT_STATUSES
+    # gRPC errors are only known if grpcio is installed, so they are
+    # identified by their status code instead of by their type
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            return getattr(code(), "name", None) in TRANSIENT_GRPC_CODES
+        except Exception:
+            return False
+    return False
+
+
+@dataclass
+class ConnectionSettings:
+    """
+    Transport settings of the Qdrant client, read from the
+    `vectordb.connection` section of the configuration: size of the pool of
+    HTTP connections, keep-alive of the HTTP and gRPC connections, timeout
+    of each call and retries with exponential backoff.
+    """
+
+    timeout: int = 10
+    pool_size: int = 16
+    keepalive_seconds: float = 30.0
+    retries: int = 3
+    backoff_seconds: float = 0.2
+    max_backoff_seconds: float = 5.0
+
+    @classmethod
+    def from_config(cls) -> "ConnectionSettings":
+        """Load the settings of the configuration."""
+        return cls(**(config["vectordb"]["connection"] or {}))
+
+    def client_options(self) -> Dict[str, Any]:
+        """Build the keyword arguments of `QdrantClient` for these
+        settings. The HTTP pool is kept alive even for localhost, where the
+        client disables keep-alive by default."""
+        import httpx
+
+        keepalive_ms = int(self.keepalive_seconds * 1000)
+        return {
+            "timeout": self.timeout,
+            "limits": httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_seconds,
+            ),
+            "grpc_options": {
+                "grpc.keepalive_time_ms": keepalive_ms,
+                "grpc.keepalive_timeout_ms": self.timeout * 1000,
+                "grpc.keepalive_permit_without_calls": 1,
+            },
+        }
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the given retry, growing exponentially
+        with full jitter so concurrent callers do not retry in lockstep."""
+        ceiling = min(
+            self.max_backoff_seconds, self.backoff_seconds * 2**attempt
+        )
+        return random.uniform(0, ceiling)
+
+
+class RetryingClient:
+    """
+    Wraps a sync or async Qdrant client so that every call is repeated,
+    after a backoff, when it fails with a transient error. Other attributes
+    are read from the wrapped client.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        settings: ConnectionSettings,
+        logger: Logger = logger,
+    ):
+        self._client = client
+        self._settings = settings
+        self._logger = logger
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        if inspect.iscoroutinefunction(attribute):
+            wrapper = self._retry_async(name, attribute)
+        else:
+            wrapper = self._retry(name, attribute)
+        # Keep the wrapper, so later calls do not go through __getattr__
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def _should_retry(
+        self, name: str, error: BaseException, attempt: int
+    ) -> bool:
+        """Check if a failed call is retried, logging and counting it."""
+        if attempt >= self._settings.retries or not is_transient(error):
+            return False
+        retried_calls.inc(method=name)
+        self._logger.warning(
+            "Retrying %s after error (%d/%d): %s",
+            name,
+            attempt + 1,
+            self._settings.retries,
+            error,
+        )
+        return True
+
+    def _retry(self, name: str, method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return method(*args, **kwargs)
+                except Exception as e:
+                    if not self._should_retry(name, e, attempt):
+                        raise
+                time.sleep(self._settings.backoff(attempt))
+                attempt += 1
+
+        return wrapper
+
+    def _retry_async(self, name: str, method: Callable) -> Callable:
+        @wraps(method)
+        async def wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return await method(*args, **kwargs)
+                except Exception as e:
+                    if not self._should_retry(name, e, attempt):
+                        raise
+                await asyncio.sleep(self._settings.backoff(attempt))
+                attempt += 1
+
+        return wrapper
+
+
+def is_ready(client: Any) -> bool:
+    """Check if Qdrant answers requests, listing its collections. The
+    probe is not retried, its callers poll instead."""
+    if isinstance(client, RetryingClient):
+        client = client._client
+    try:
+        client.get_collections()
+        return True
+    except Exception:
+        return False
+
+
+def wait_until_ready(
+    client: Any,
+    timeout: float = config["vectordb"]["ready_timeout"],
+    interval: float = 0.5,
+    logger: Logger = logger,
+) -> None:
+    """Wait until Qdrant answers requests, e.g. while its container starts.
+    Raise a ConnectionError if it is not ready after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while not is_ready(client):
+        if time.monotonic() >= deadline:
+            raise ConnectionError(
+                f"Qdrant is not ready after {timeout} seconds"
+            )
+        logger.info("Waiting for Qdrant to be ready")
+        time.sleep(interval)
@@ -1,30 +1,84 @@
 import os
 from dataclasses import dataclass
-from typing import Callable, Dict, Generator, Optional, Union
-
-import pandas as pd
+from functools import lru_cache
+from itertools import islice
+from typing import (
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 from configuration.load import config
 
+T = TypeVar("T")
+
 
 @dataclass
 class DataToUpsert:
     value: str
     payload: Optional[Dict[str, Union[str, int]]] = None
+    digest: Optional[str] = None
+
+
+class MetadataIndex:
+    """
+    Metadata of the files indexed by filename, built once from one or more
+    CSV sources. When a file appears in several sources, the last one wins.
+    """
+
+    def __init__(
+        self, paths: List[str], fields: List[str], key: str = "filename"
+    ):
+        import pandas as pd
+
+        self._rows: Dict[str, Dict[str, Union[str, int, bool]]] = {}
+        for path in paths:
+            metadata = pd.read_csv(path, sep=",", usecols=[key, *fields])
+            self._rows.update(
+                metadata.drop_duplicates(key, keep="last")
+                .set_index(key)[fields]
+                .to_dict("index")
+            )
+
+    def get(self, filename: str) -> Dict[str, Union[str, int, bool]]:
+        """Get the metadata of a file, empty if it is not indexed."""
+        return self._rows.get(filename, {})
+
+    def values(self, field: str) -> List[Union[str, int, bool]]:
+        """Get the distinct values of a field, sorted."""
+        return sorted(
+            {row[field] for row in self._rows.values() if field in row}
+        )
+
+
+@lru_cache(maxsize=None)
+def get_metadata_audios() -> MetadataIndex:
+    """Load the metadata of the audios on first use."""
+    paths = config["local"]["metadata_audios"]
+    return MetadataIndex(
+        paths=[paths] if isinstance(paths, str) else paths,
+        fields=config["local"]["metadata_audios_fields"],
+    )
 
 
-# Load the metadata
-metadata_audios = pd.read_csv(config["local"]["metadata_audios"], sep=",")
+@lru_cache(maxsize=None)
+def get_audio_categories() -> List[str]:
+    """Get the categories of the audios as readable labels, e.g. "chirping
+    birds" for the ESC-50 category `chirping_birds`."""
+    return [
+        str(category).replace("_", " ")
+        for category in get_metadata_audios().values("category")
+    ]
 
 
 def get_category_from_filename(filename: str) -> str:
     """Get the category from the filename."""
-    try:
-        return metadata_audios[metadata_audios["filename"] == filename][
-            "category"
-        ].values[0]
-    except IndexError:
-        return "unknown"
+    return get_metadata_audios().get(filename).get("category", "unknown")
 
 
 def create_data_to_upsert(
@@ -43,13 +97,27 @@ def create_data_to_upsert(
         )
 
 
+def batched(
+    items: Iterable[T], batch_size: int
+) -> Generator[List[T], None, None]:
+    """Group the items, e.g. the data to upsert, in lists of at most
+    `batch_size` items."""
+    if batch_size < 1:
+        raise ValueError("The batch size must be greater than zero.")
+
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
 def audio_payload_generator(file: str) -> Dict[str, str]:
-    """Generate payload for audio files."""
-    category = get_category_from_filename(file)
+    """Generate payload for audio files, including the ESC-50 metadata of
+    the file (category, fold, target, esc10) when available."""
     return {
+        "category": "unknown",
+        **get_metadata_audios().get(file),
         "type": "sound",
         "filename": file,
-        "category": category,
     }
 
 
@@ -1,17 +1,22 @@
-from logging import DEBUG, Formatter, Logger, StreamHandler, getLogger
+from logging import Formatter, Logger, StreamHandler, getLogger
+
+from configuration.load import config
 
 
 def get_logger(name: str) -> Logger:
-    """Get a logger object."""
+    """Get a logger object. The handler is only added the first time, so
+    calling this again for the same name does not duplicate the lines."""
     logger = getLogger(name)
-    logger.setLevel(DEBUG)
-    handler = StreamHandler()
-    handler.setLevel(DEBUG)
-    formatter = Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger.setLevel(config["logging"]["level"])
+    if not logger.handlers:
+        handler = StreamHandler()
+        formatter = Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+        # Do not repeat the lines in the handlers of the root logger
+        logger.propagate = False
     return logger
 
 
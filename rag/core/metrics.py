@@ -0,0 +1,237 @@
+import json
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Generator, Iterable, Tuple
+
+from configuration.load import config
+from rag.core.logger import logger
+
+# Upper bounds in seconds of the buckets of the latency histograms
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Label values of a metric, as sorted (name, value) pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with one value per combination of labels."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def to_prometheus(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in self._values.items():
+                yield f"{self.name}{_format_labels(labels)} {value}"
+
+    def to_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                _format_labels(labels): value
+                for labels, value in self._values.items()
+            }
+
+
+class Histogram:
+    """Histogram of observations in fixed buckets, with one series per
+    combination of labels."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # Per labels: count of each bucket (non cumulative), sum and count
+        self._series: Dict[Labels, Tuple[list, float, int]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._series.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0, 0)
+            )
+            counts[index] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def to_prometheus(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {
+                labels: (list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+        for labels, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, "+Inf"), counts
+            ):
+                cumulative += bucket_count
+                bucket_labels = _format_labels((*labels, ("le", str(bound))))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                _format_labels(labels): {
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else 0.0,
+                    "buckets": dict(
+                        zip(map(str, (*self.buckets, "+Inf")), counts)
+                    ),
+                }
+                for labels, (counts, total, count) in self._series.items()
+            }
+
+
+class Metrics:
+    """
+    Registry of the counters and histograms of the process, with timed
+    spans around the hot paths. With a `sample_rate` below 1, only that
+    fraction of the spans is timed, which keeps the overhead and the logs
+    bounded under load; the span histograms then hold a sample of the
+    calls, while counters always count every event.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        sample_rate: float = 1.0,
+        log_spans: bool = False,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.log_spans = log_spans
+        self._metrics: Dict[str, object] = {}
+        self._lock = Lock()
+        self.spans = self.histogram(
+            "rag_span_seconds", "Duration of the instrumented operations"
+        )
+        self.span_errors = self.counter(
+            "rag_span_errors_total", "Instrumented operations that failed"
+        )
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Get or create a counter."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, description)
+            return self._metrics[name]
+
+    def histogram(self, name: str, description: str) -> Histogram:
+        """Get or create a histogram with the default buckets."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description)
+            return self._metrics[name]
+
+    @contextmanager
+    def span(self, name: str, **labels: str) -> Generator[None, None, None]:
+        """Time the enclosed block as the span `name`."""
+        if not self.enabled or (
+            self.sample_rate < 1.0 and random.random() >= self.sample_rate
+        ):
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.span_errors.inc(span=name, **labels)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.spans.observe(seconds, span=name, **labels)
+            if self.log_spans:
+                logger.info("Span %s %s took %.4fs", name, labels, seconds)
+
+    def timed(self, name: str, **labels: str) -> Callable:
+        """Decorator that times every call of a function as a span."""
+
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def to_prometheus(self) -> str:
+        """Export all the metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = [line for metric in metrics for line in metric.to_prometheus()]
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Dict]:
+        """Export all the metrics as a dict, e.g. to dump them as JSON."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.to_dict() for metric in metrics}
+
+    def write(self, path: str) -> None:
+        """Write the metrics to a file, in the Prometheus text format if it
+        ends in `.prom` or as JSON otherwise."""
+        with open(path, "w") as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, indent=2)
+
+
+# Instantiate the metrics of the process
+metrics = Metrics(
+    enabled=config["metrics"]["enabled"],
+    sample_rate=config["metrics"]["sample_rate"],
+    log_spans=config["metrics"]["log_spans"],
+)
@@ -1,36 +1,142 @@
 import os
+import time
 from enum import Enum
-from typing import List, Optional, Union
-
-import torch
-from dotenv import load_dotenv
-from groq import Groq
-from msclap import CLAP
-from PIL import Image
-from transformers import (
-    AutoImageProcessor,
-    AutoModel,
-    AutoProcessor,
-    AutoTokenizer,
-    BlipForConditionalGeneration,
-)
+from typing import Callable, Dict, List, Optional, Union
 
-from configuration.load import config
+import numpy as np
 
-# Instantiate the model for audio
-model_audio = CLAP()
-MODEL_AUDIO_DIM = model_audio.args.d_proj
+from configuration.load import config
+from rag.core.metrics import metrics
+from rag.core.registry import ModelRegistry
 
-# Instantiate the model for images
+# The heavy dependencies (torch, msclap, transformers, groq) are imported by
+# the loaders below, so importing this module does not load any weights.
+# The dimensions come from the configuration for the same reason.
+MODEL_AUDIO_DIM = config["msclap"]["dim"]
+MODEL_IMAGE_DIM = config["huggingface"]["image_text_model_dim"]
 model_path = config["huggingface"]["image_text_model"]
-model_image = AutoModel.from_pretrained(model_path)
-processor_image = AutoImageProcessor.from_pretrained(model_path)
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-MODEL_IMAGE_DIM = model_image.projection_dim
 
-# Instantiate the LLM client
-load_dotenv()
-llm_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Backend used to run CLIP and CLAP on CPU: fp32, int8 (dynamic quantization
+# of the linear layers) or torchscript (traced audio and image encoders)
+INFERENCE_BACKEND = config["inference"]["backend"]
+INFERENCE_BACKENDS = ("fp32", "int8", "torchscript")
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    raise ValueError(f"Unsupported inference backend: {INFERENCE_BACKEND}")
+
+
+def _configure_torch() -> None:
+    """Apply the intra-op thread setting of the inference configuration."""
+    import torch
+
+    if config["inference"]["num_threads"]:
+        torch.set_num_threads(config["inference"]["num_threads"])
+
+
+def _quantize(module):
+    """Apply dynamic int8 quantization to the linear layers of a module."""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        module, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _load_model_audio(backend: str = INFERENCE_BACKEND):
+    """Instantiate the model for audio."""
+    from msclap import CLAP
+
+    _configure_torch()
+    model = CLAP(version=config["msclap"]["version"])
+    if backend == "int8":
+        model.clap = _quantize(model.clap)
+    return model
+
+
+def _load_model_image(backend: str = INFERENCE_BACKEND):
+    """Instantiate the model for images."""
+    from transformers import AutoModel
+
+    _configure_torch()
+    model = AutoModel.from_pretrained(model_path).eval()
+    if backend == "int8":
+        model = _quantize(model)
+    return model
+
+
+def _load_audio_encoder(backend: str = INFERENCE_BACKEND):
+    """Build the function that embeds a batch of waveforms with shape
+    (batch, samples). With the torchscript backend it is a traced graph."""
+    import torch
+
+    model = models.get("audio").clap.eval()
+
+    def encode(waveforms):
+        return model.audio_encoder(waveforms)[0]
+
+    if backend == "torchscript":
+        num_samples = (
+            config["msclap"]["sampling_rate"] * config["msclap"]["duration"]
+        )
+        with torch.no_grad():
+            return torch.jit.trace(
+                encode, torch.zeros(1, num_samples), check_trace=False
+            )
+    return encode
+
+
+def _load_image_encoder(backend: str = INFERENCE_BACKEND):
+    """Build the function that embeds a batch of pixel values. With the
+    torchscript backend it is a traced graph."""
+    import torch
+
+    model = models.get("image")
+
+    def encode(pixel_values):
+        return model.get_image_features(pixel_values=pixel_values)
+
+    if backend == "torchscript":
+        size = models.get("image_processor").crop_size
+        with torch.no_grad():
+            return torch.jit.trace(
+                encode,
+                torch.zeros(1, 3, size["height"], size["width"]),
+                check_trace=False,
+            )
+    return encode
+
+
+def _load_processor_image():
+    """Instantiate the processor for images."""
+    from transformers import AutoImageProcessor
+
+    return AutoImageProcessor.from_pretrained(model_path)
+
+
+def _load_tokenizer():
+    """Instantiate the tokenizer for the image-text model."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_path)
+
+
+def _load_llm_client():
+    """Instantiate the LLM client."""
+    from dotenv import load_dotenv
+    from groq import Groq
+
+    load_dotenv()
+    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+# Models are loaded on first use
+models = ModelRegistry()
+models.register("audio", _load_model_audio)
+models.register("image", _load_model_image)
+models.register("audio_encoder", _load_audio_encoder)
+models.register("image_encoder", _load_image_encoder)
+models.register("image_processor", _load_processor_image)
+models.register("tokenizer", _load_tokenizer)
+models.register("llm", _load_llm_client)
 
 
 class Model(Enum):
@@ -43,6 +149,32 @@ class Model(Enum):
     CLAP = "CLAP"
 
 
+# Identifier of the weights behind each model, used to key cached embeddings.
+# The inference backend is part of it, since int8 and torchscript produce
+# slightly different vectors than fp32 and they must not be mixed.
+model_ids = {
+    Model.CLAP: f"msclap-{config['msclap']['version']}@{INFERENCE_BACKEND}",
+    Model.CLIP: f"{model_path}@{INFERENCE_BACKEND}",
+}
+
+# Identifier of the captioning models, used to key cached captions. Audios
+# and images never share a digest, so one id covers both models.
+caption_model_id = f"clapcap+{config['huggingface']['image_caption_model']}"
+
+
+def to_vectors(embeddings) -> np.ndarray:
+    """Convert a batch of embeddings, a tensor or an array, to a contiguous
+    float32 matrix whose rows have unit L2 norm. This is the layout used
+    from the models to Qdrant, so the vectors are normalized only once."""
+    if hasattr(embeddings, "detach"):
+        embeddings = embeddings.detach().cpu().numpy()
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
 class Modalities(Enum):
     """
     Enum for specifying the modality of the data
@@ -54,17 +186,32 @@ class Modalities(Enum):
     IMAGE = "image"
 
 
+@metrics.timed("embed", model=Model.CLAP.value)
 def create_embeddings_audio(
     modality: Modalities,
     audio_paths: Optional[Union[str, List[str]]] = None,
     texts_list: Optional[Union[str, List[str]]] = None,
-) -> List[float]:
-    """Create embeddings for audio or text data based on the given modality."""
+    batch: bool = False,
+) -> np.ndarray:
+    """Create embeddings for audio or text data based on the given modality.
+    If `batch` is True, return one embedding per input instead of only the
+    first one. Embeddings are normalized float32 arrays."""
+    import torch
+
     if modality == Modalities.TEXT and texts_list is not None:
-        embedding = model_audio.get_text_embeddings(texts_list)
+        embedding = models.get("audio").get_text_embeddings(texts_list)
 
     elif modality == Modalities.AUDIO and audio_paths is not None:
-        embedding = model_audio.get_audio_embeddings(audio_paths)
+        if isinstance(audio_paths, str):
+            audio_paths = [audio_paths]
+
+        waveforms = models.get("audio").preprocess_audio(
+            audio_paths, resample=True
+        )
+        with torch.no_grad():
+            embedding = models.get("audio_encoder")(
+                waveforms.reshape(waveforms.shape[0], -1)
+            )
 
     else:
         raise ValueError(
@@ -72,34 +219,40 @@ def create_embeddings_audio(
             for the specified modality."""
         )
 
-    return embedding[0]
+    vectors = to_vectors(embedding)
+    return vectors if batch else vectors[0]
 
 
+@metrics.timed("embed", model=Model.CLIP.value)
 def create_embeddings_image(
     modality: Modalities,
     image_paths: Optional[Union[str, List[str]]] = None,
     texts_list: Optional[Union[str, List[str]]] = None,
-) -> List[float]:
-    """Create embeddings for image or text data based on the given modality."""
+    batch: bool = False,
+) -> np.ndarray:
+    """Create embeddings for image or text data based on the given modality.
+    If `batch` is True, return one embedding per input instead of only the
+    first one. Embeddings are normalized float32 arrays."""
+    import torch
+    from PIL import Image
+
     if modality == Modalities.TEXT and texts_list is not None:
-        inputs = tokenizer(
+        inputs = models.get("tokenizer")(
             texts_list, return_tensors="pt", padding=True, truncation=True
         )
         with torch.no_grad():
-            embedding = model_image.get_text_features(**inputs)
-
-        return embedding.tolist()[0]
+            embedding = models.get("image").get_text_features(**inputs)
 
     elif modality == Modalities.IMAGE and image_paths is not None:
         if isinstance(image_paths, str):
             image_paths = [image_paths]
 
         images = [Image.open(image_path) for image_path in image_paths]
-        inputs = processor_image(images=images, return_tensors="pt")
+        inputs = models.get("image_processor")(
+            images=images, return_tensors="pt"
+        )
         with torch.no_grad():
-            embedding = model_image.get_image_features(**inputs)
-
-        return embedding.tolist()[0]
+            embedding = models.get("image_encoder")(inputs["pixel_values"])
 
     else:
         raise ValueError(
@@ -107,26 +260,189 @@ def create_embeddings_image(
             for the specified modality."""
         )
 
+    vectors = to_vectors(embedding)
+    return vectors if batch else vectors[0]
 
-def create_caption(modality: Modalities, path: Union[str, List[str]]) -> str:
-    """Create caption for the given audio."""
-    if modality == Modalities.AUDIO:
-        model = CLAP(version="clapcap")
-        caption = model.generate_caption([path], temperature=0.01)[0]
 
-    elif modality == Modalities.IMAGE:
-        processor = AutoProcessor.from_pretrained(
-            config["huggingface"]["image_caption_model"]
+@metrics.timed("embed_inputs")
+def create_embeddings_from_inputs(
+    model: Model, inputs: np.ndarray
+) -> np.ndarray:
+    """Create embeddings for a batch of media already decoded and
+    preprocessed by `rag.core.preprocessing.preprocess_batch`."""
+    import torch
+
+    tensor = torch.from_numpy(inputs)
+    with torch.no_grad():
+        if model == Model.CLAP:
+            embedding = models.get("audio_encoder")(tensor)
+        elif model == Model.CLIP:
+            embedding = models.get("image_encoder")(tensor)
+        else:
+            raise ValueError(f"Unsupported model type: {model}")
+
+    return to_vectors(embedding)
+
+
+def _cosine_similarities(
+    embeddings: List[List[float]], references: List[List[float]]
+) -> np.ndarray:
+    """Cosine similarity between each embedding and its reference."""
+    embeddings, references = np.asarray(embeddings), np.asarray(references)
+    return np.sum(embeddings * references, axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(references, axis=1)
+    )
+
+
+def check_inference_backend(
+    audio_paths: List[str], image_paths: List[str], texts: List[str]
+) -> Dict[str, Dict[str, float]]:
+    """Compare the embeddings of the configured inference backend with the
+    ones of the fp32 models, reporting the cosine similarity between them
+    and the time taken by each one for every model and modality."""
+    import torch
+
+    reference_audio = _load_model_audio(backend="fp32")
+    reference_image = _load_model_image(backend="fp32")
+
+    def reference_image_embeddings(paths: List[str]) -> List[List[float]]:
+        from PIL import Image
+
+        images = [Image.open(path) for path in paths]
+        inputs = models.get("image_processor")(
+            images=images, return_tensors="pt"
         )
-        model = BlipForConditionalGeneration.from_pretrained(
-            config["huggingface"]["image_caption_model"]
+        return reference_image.get_image_features(**inputs).tolist()
+
+    def reference_text_embeddings(texts: List[str]) -> List[List[float]]:
+        inputs = models.get("tokenizer")(
+            texts, return_tensors="pt", padding=True, truncation=True
         )
-        image = Image.open(path)
-        inputs = processor(images=image, return_tensors="pt")
-        output = model.generate(**inputs)
-        caption = processor.decode(output[0], skip_special_tokens=True)
+        return reference_image.get_text_features(**inputs).tolist()
+
+    checks: Dict[str, tuple] = {
+        "clap_audio": (
+            audio_paths,
+            lambda values: create_embeddings_audio(
+                Modalities.AUDIO, audio_paths=values, batch=True
+            ),
+            lambda values: reference_audio.get_audio_embeddings(
+                values
+            ).tolist(),
+        ),
+        "clap_text": (
+            texts,
+            lambda values: create_embeddings_audio(
+                Modalities.TEXT, texts_list=values, batch=True
+            ),
+            lambda values: reference_audio.get_text_embeddings(
+                values
+            ).tolist(),
+        ),
+        "clip_image": (
+            image_paths,
+            lambda values: create_embeddings_image(
+                Modalities.IMAGE, image_paths=values, batch=True
+            ),
+            reference_image_embeddings,
+        ),
+        "clip_text": (
+            texts,
+            lambda values: create_embeddings_image(
+                Modalities.TEXT, texts_list=values, batch=True
+            ),
+            reference_text_embeddings,
+        ),
+    }
+
+    def timed(function: Callable, values: List[str]) -> tuple:
+        start = time.perf_counter()
+        with torch.no_grad():
+            result = function(values)
+        return result, time.perf_counter() - start
+
+    report = {}
+    for name, (values, backend_function, reference_function) in checks.items():
+        if not values:
+            continue
+        embeddings, backend_seconds = timed(backend_function, values)
+        references, reference_seconds = timed(reference_function, values)
+        similarities = _cosine_similarities(embeddings, references)
+        report[name] = {
+            "items": len(values),
+            "mean_cosine_similarity": float(similarities.mean()),
+            "min_cosine_similarity": float(similarities.min()),
+            f"{INFERENCE_BACKEND}_seconds": backend_seconds,
+            "fp32_seconds": reference_seconds,
+        }
+
+    return report
+
+
+def _load_caption_model_audio():
+    """Instantiate the captioning model for audio."""
+    from msclap import CLAP
+
+    return CLAP(version="clapcap")
+
+
+def _load_caption_model_image():
+    """Instantiate the captioning processor and model for images."""
+    from transformers import AutoProcessor, BlipForConditionalGeneration
+
+    processor = AutoProcessor.from_pretrained(
+        config["huggingface"]["image_caption_model"]
+    )
+    model = BlipForConditionalGeneration.from_pretrained(
+        config["huggingface"]["image_caption_model"]
+    )
+    return processor, model
+
+
+# Captioning models are kept loaded between calls, evicting the least
+# recently used one when more than `max_loaded` are in memory
+caption_models = ModelRegistry(max_loaded=config["captions"]["max_loaded"])
+caption_models.register(Modalities.AUDIO.value, _load_caption_model_audio)
+caption_models.register(Modalities.IMAGE.value, _load_caption_model_image)
+
+
+def warm_up_caption_models(
+    modalities: Optional[List[Modalities]] = None,
+) -> None:
+    """Load the captioning models ahead of the first request."""
+    caption_models.warm_up(
+        [modality.value for modality in modalities]
+        if modalities is not None
+        else None
+    )
+
+
+@metrics.timed("caption")
+def create_captions(modality: Modalities, paths: List[str]) -> List[str]:
+    """Create captions for a batch of audios or images in a single call to
+    the captioning model."""
+    import torch
+    from PIL import Image
+
+    if modality == Modalities.AUDIO:
+        model = caption_models.get(modality.value)
+        return model.generate_caption(paths, temperature=0.01)
+
+    elif modality == Modalities.IMAGE:
+        processor, model = caption_models.get(modality.value)
+        images = [Image.open(path) for path in paths]
+        inputs = processor(images=images, return_tensors="pt")
+        with torch.no_grad():
+            output = model.generate(**inputs)
+        return processor.batch_decode(output, skip_special_tokens=True)
+
+    else:
+        raise ValueError(f"Unsupported modality for captions: {modality}")
+
 
-    return caption
+def create_caption(modality: Modalities, path: str) -> str:
+    """Create caption for the given audio or image."""
+    return create_captions(modality=modality, paths=[path])[0]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from logging import Logger
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from configuration.load import config
+from rag.core.cache import EmbeddingCache, file_digest
+from rag.core.data import DataToUpsert, batched
+from rag.core.logger import logger
+from rag.core.models import Model, model_ids
+from rag.core.preprocessing import preprocess_batch
+from rag.core.vectordb import QdrantWrapper
+
+# Marks the end of the items flowing through a queue
+_END = object()
+
+
+@dataclass
+class StageStats:
+    """Number of items processed by a stage and the time spent on them."""
+
+    name: str
+    items: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items processed per second of work in the stage."""
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+def _timed_preprocess_batch(
+    model: Model, paths: List[str]
+) -> Tuple[np.ndarray, float]:
+    """Preprocess a batch in a worker and return the time it took."""
+    start = time.perf_counter()
+    inputs = preprocess_batch(model=model, paths=paths)
+    return inputs, time.perf_counter() - start
+
+
+class IngestPipeline:
+    """
+    Staged ingest pipeline connected by bounded queues:
+
+    1. decode: a process pool decodes and preprocesses the media files.
+       Files whose embedding is already in the cache are not decoded.
+    2. embed: the calling thread runs the model on the preprocessed batches,
+       and optionally captions them.
+    3. upload: a pool of threads upserts the points to Qdrant.
+
+    The bounded queues apply backpressure, so a slow stage throttles the
+    others instead of accumulating batches in memory.
+    """
+
+    def __init__(
+        self,
+        qdrant_manager: QdrantWrapper,
+        embedding_function: Callable[[Model, np.ndarray], np.ndarray],
+        batch_size: int = config["ingest"]["batch_size"],
+        num_workers: int = config["ingest"]["workers"],
+        num_upload_workers: int = config["ingest"]["upload_workers"],
+        queue_size: int = config["ingest"]["queue_size"],
+        embedding_cache: Optional[EmbeddingCache] = None,
+        logger: Logger = logger,
+    ):
+        self._qdrant_manager = qdrant_manager
+        self._embedding_function = embedding_function
+        self._batch_size = batch_size
+        self._num_workers = num_workers
+        self._num_upload_workers = num_upload_workers
+        self._queue_size = queue_size
+        self._embedding_cache = embedding_cache
+        self._logger = logger
+
+    def run(
+        self,
+        collection_name: str,
+        data_to_upsert: Iterable[DataToUpsert],
+        vector_name: Optional[str] = None,
+        caption_function: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> Dict[str, StageStats]:
+        """Embed and upsert all the data to the given collection, as the
+        given named vector if any. If `caption_function` is given, the
+        files are also captioned after being embedded."""
+        model = QdrantWrapper.get_model(collection_name, vector_name)
+        stages = ["decode", "embed", "upload"]
+        if caption_function is not None:
+            stages.insert(2, "caption")
+        stats = {name: StageStats(name) for name in stages}
+        stats_lock = Lock()
+        decoded: Queue = Queue(maxsize=self._queue_size)
+        embedded: Queue = Queue(maxsize=self._queue_size)
+        stop = Event()
+        errors: List[BaseException] = []
+
+        def put(queue: Queue, item: object) -> bool:
+            """Put an item in a queue unless the pipeline was stopped."""
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def get(queue: Queue) -> object:
+            """Get an item from a queue, or `_END` if the pipeline was
+            stopped."""
+            while not stop.is_set():
+                try:
+                    return queue.get(timeout=0.1)
+                except Empty:
+                    continue
+            return _END
+
+        def produce(executor: ProcessPoolExecutor) -> None:
+            try:
+                for batch in batched(data_to_upsert, self._batch_size):
+                    cached = self._lookup_cache(model, batch)
+                    missing = [
+                        item for item in batch if item.digest not in cached
+                    ]
+                    future = None
+                    if missing:
+                        future = executor.submit(
+                            _timed_preprocess_batch,
+                            model,
+                            [item.value for item in missing],
+                        )
+                    if not put(decoded, (batch, cached, missing, future)):
+                        if future is not None:
+                            future.cancel()
+                        return
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(decoded, _END)
+
+        def upload() -> None:
+            while (entry := get(embedded)) is not _END:
+                batch, embeddings, caption_embeddings = entry
+                try:
+                    start = time.perf_counter()
+                    self._qdrant_manager.upsert_points(
+                        collection_name=collection_name,
+                        data=batch,
+                        embeddings=embeddings,
+                        vector_name=vector_name,
+                        caption_embeddings=caption_embeddings,
+                    )
+                    seconds = time.perf_counter() - start
+                    with stats_lock:
+                        stats["upload"].items += len(batch)
+                        stats["upload"].seconds += seconds
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                    return
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self._num_workers) as executor:
+            producer = Thread(target=produce, args=(executor,), daemon=True)
+            uploaders = [
+                Thread(target=upload, daemon=True)
+                for _ in range(self._num_upload_workers)
+            ]
+            producer.start()
+            for uploader in uploaders:
+                uploader.start()
+
+            try:
+                self._embed(
+                    model=model,
+                    stats=stats,
+                    get=lambda: get(decoded),
+                    put=lambda item: put(embedded, item),
+                    vector_name=vector_name,
+                    caption_function=caption_function,
+                )
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for _ in uploaders:
+                    put(embedded, _END)
+                producer.join()
+                for uploader in uploaders:
+                    uploader.join()
+                if stop.is_set():
+                    executor.shutdown(cancel_futures=True)
+
+        if errors:
+            raise errors[0]
+
+        self._log_stats(stats, elapsed=time.perf_counter() - start)
+        return stats
+
+    def _embed(
+        self,
+        model: Model,
+        stats: Dict[str, StageStats],
+        get: Callable[[], object],
+        put: Callable[[object], bool],
+        vector_name: Optional[str] = None,
+        caption_function: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> None:
+        """Run the model over the decoded batches, and the captioning model
+        if given, and pass the embeddings to the upload stage."""
+        while (entry := get()) is not _END:
+            batch, embeddings, missing, future = entry
+            if future is not None:
+                inputs, decode_seconds = future.result()
+                stats["decode"].items += len(missing)
+                stats["decode"].seconds += decode_seconds
+
+                start = time.perf_counter()
+                computed = self._embedding_function(model, inputs)
+                stats["embed"].items += len(missing)
+                stats["embed"].seconds += time.perf_counter() - start
+
+                computed = {
+                    item.digest: embedding
+                    for item, embedding in zip(missing, computed)
+                }
+                if self._embedding_cache is not None:
+                    self._embedding_cache.put_many(model_ids[model], computed)
+                embeddings.update(computed)
+
+            embeddings = np.stack([embeddings[item.digest] for item in batch])
+            caption_embeddings = None
+            if caption_function is not None:
+                start = time.perf_counter()
+                caption_embeddings = self._qdrant_manager.caption_points(
+                    data=batch,
+                    caption_function=caption_function,
+                    vector_name=vector_name,
+                    embedding_cache=self._embedding_cache,
+                )
+                stats["caption"].items += len(batch)
+                stats["caption"].seconds += time.perf_counter() - start
+
+            if not put((batch, embeddings, caption_embeddings)):
+                return
+
+    def _lookup_cache(
+        self, model: Model, batch: List[DataToUpsert]
+    ) -> Dict[str, np.ndarray]:
+        """Hash the files of a batch and get their cached embeddings."""
+        for item in batch:
+            item.digest = item.digest or file_digest(item.value)
+
+        if self._embedding_cache is None:
+            return {}
+
+        return self._embedding_cache.get_many(
+            model_ids[model], [item.digest for item in batch]
+        )
+
+    def _log_stats(self, stats: Dict[str, StageStats], elapsed: float):
+        """Log the throughput of each stage and of the whole pipeline."""
+        for stage in stats.values():
+            self._logger.info(
+                f"Stage {stage.name}: {stage.items} items in "
+                f"{stage.seconds:.2f}s ({stage.throughput:.2f} items/s)"
+            )
+        total = stats["upload"].items
+        self._logger.info(
+            f"Pipeline: {total} items in {elapsed:.2f}s "
+            f"({total / elapsed if elapsed else 0.0:.2f} items/s)"
+        )
@@ -0,0 +1,113 @@
+from typing import Generator, List, Optional, Tuple
+
+import numpy as np
+
+from configuration.load import config
+from rag.core.models import Model, models
+
+AUDIO_SAMPLING_RATE = config["msclap"]["sampling_rate"]
+AUDIO_DURATION = config["msclap"]["duration"]
+AUDIO_NUM_SAMPLES = AUDIO_SAMPLING_RATE * AUDIO_DURATION
+
+
+def _fit_length(waveform: np.ndarray, num_samples: int) -> np.ndarray:
+    """Repeat short waveforms and crop long ones to `num_samples`."""
+    if num_samples >= waveform.shape[0]:
+        repeat_factor = int(np.ceil(num_samples / waveform.shape[0]))
+        waveform = np.tile(waveform, repeat_factor)
+    return waveform[0:num_samples]
+
+
+def load_audio(audio_path: str) -> np.ndarray:
+    """Load an audio file as the fixed-length waveform expected by CLAP.
+    Mirrors `msclap.CLAP.load_audio_into_tensor`, but always keeps the
+    first window of long audios so the result is deterministic."""
+    import torch
+    import torchaudio
+    import torchaudio.transforms as T
+
+    audio_time_series, sample_rate = torchaudio.load(audio_path)
+    if sample_rate != AUDIO_SAMPLING_RATE:
+        resampler = T.Resample(sample_rate, AUDIO_SAMPLING_RATE)
+        audio_time_series = resampler(audio_time_series)
+    audio_time_series = audio_time_series.reshape(-1)
+
+    return _fit_length(
+        audio_time_series.to(torch.float32).numpy(), AUDIO_NUM_SAMPLES
+    )
+
+
+def _to_float_mono(samples: np.ndarray) -> np.ndarray:
+    """Convert PCM samples to float32 in [-1, 1] and mix them down to
+    mono."""
+    if samples.dtype == np.uint8:
+        samples = (samples.astype(np.float32) - 128) / 128
+    elif np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype(np.float32) / -np.iinfo(samples.dtype).min
+    else:
+        samples = samples.astype(np.float32)
+
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    return samples
+
+
+def iter_audio_windows(
+    audio_path: str,
+    window_seconds: float = AUDIO_DURATION,
+    hop_seconds: Optional[float] = None,
+) -> Generator[Tuple[float, float, np.ndarray], None, None]:
+    """Read a WAV file in fixed windows of `window_seconds`, starting every
+    `hop_seconds` (the window length by default), and yield the start and
+    end offsets in seconds of each window with its waveform ready for CLAP.
+    The file is memory-mapped, so only the current window is loaded."""
+    import torch
+    import torchaudio.functional as F
+    from scipy.io import wavfile
+
+    try:
+        sample_rate, samples = wavfile.read(audio_path, mmap=True)
+    except ValueError:
+        # Some encodings (e.g. 24-bit PCM) cannot be memory-mapped
+        sample_rate, samples = wavfile.read(audio_path)
+    if samples.shape[0] == 0:
+        return
+
+    window = max(int(window_seconds * sample_rate), 1)
+    hop = max(int((hop_seconds or window_seconds) * sample_rate), 1)
+    start = 0
+    while True:
+        end = min(start + window, samples.shape[0])
+        waveform = _to_float_mono(np.array(samples[start:end]))
+        if sample_rate != AUDIO_SAMPLING_RATE:
+            waveform = F.resample(
+                torch.from_numpy(waveform), sample_rate, AUDIO_SAMPLING_RATE
+            ).numpy()
+        yield (
+            start / sample_rate,
+            end / sample_rate,
+            _fit_length(waveform, AUDIO_NUM_SAMPLES),
+        )
+
+        if end >= samples.shape[0]:
+            return
+        start += hop
+
+
+def load_image(image_path: str) -> np.ndarray:
+    """Load an image file as the pixel values expected by CLIP."""
+    from PIL import Image
+
+    image = Image.open(image_path)
+    inputs = models.get("image_processor")(images=image, return_tensors="np")
+    return inputs["pixel_values"][0]
+
+
+def preprocess_batch(model: Model, paths: List[str]) -> np.ndarray:
+    """Decode and preprocess a batch of files for the given model."""
+    if model == Model.CLAP:
+        return np.stack([load_audio(path) for path in paths])
+    elif model == Model.CLIP:
+        return np.stack([load_image(path) for path in paths])
+    else:
+        raise ValueError(f"Unsupported model type: {model}")
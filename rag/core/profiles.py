@@ -0,0 +1,98 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from qdrant_client.http import models
+
+from configuration.load import config
+
+
+@dataclass
+class CollectionProfile:
+    """
+    Storage, index and search settings of a collection, read from the
+    `vectordb.profiles` section of the configuration.
+    """
+
+    name: str
+    hnsw: Dict[str, Any] = field(default_factory=dict)
+    quantization: Optional[Dict[str, Any]] = None
+    on_disk: bool = False
+    shard_number: Optional[int] = None
+    segment_number: Optional[int] = None
+    search: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, name: Optional[str] = None) -> "CollectionProfile":
+        """Load a profile, by default the one selected in the config."""
+        name = name or config["vectordb"]["profile"]
+        try:
+            settings = config["vectordb"]["profiles"][name]
+        except KeyError:
+            raise ValueError(f"Unknown collection profile: {name}")
+        return cls(name=name, **(settings or {}))
+
+    def vectors_config(
+        self, size: int, distance: models.Distance = models.Distance.COSINE
+    ) -> models.VectorParams:
+        """Build the parameters of a vector of the given size."""
+        return models.VectorParams(
+            size=size, distance=distance, on_disk=self.on_disk
+        )
+
+    def hnsw_config(self) -> Optional[models.HnswConfigDiff]:
+        """Build the HNSW index settings (m, ef_construct, on_disk...)."""
+        return models.HnswConfigDiff(**self.hnsw) if self.hnsw else None
+
+    def quantization_config(self) -> Optional[models.QuantizationConfig]:
+        """Build the scalar or binary quantization settings."""
+        if not self.quantization:
+            return None
+
+        settings = dict(self.quantization)
+        quantization_type = settings.pop("type")
+        always_ram = settings.pop("always_ram", True)
+        if quantization_type == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    always_ram=always_ram,
+                    **settings,
+                )
+            )
+        elif quantization_type == "binary":
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=always_ram)
+            )
+        else:
+            raise ValueError(
+                f"Unsupported quantization type: {quantization_type}"
+            )
+
+    def optimizers_config(self) -> Optional[models.OptimizersConfigDiff]:
+        """Build the optimizer settings, i.e. the number of segments."""
+        if not self.segment_number:
+            return None
+        return models.OptimizersConfigDiff(
+            default_segment_number=self.segment_number
+        )
+
+    def search_params(
+        self,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+    ) -> Optional[models.SearchParams]:
+        """Build the search-time settings, overriding the `ef` of HNSW and
+        the oversampling of quantized searches if given."""
+        hnsw_ef = hnsw_ef or self.search.get("hnsw_ef")
+        oversampling = oversampling or self.search.get("oversampling")
+
+        quantization = None
+        if self.quantization:
+            quantization = models.QuantizationSearchParams(
+                rescore=self.search.get("rescore", True),
+                oversampling=oversampling,
+            )
+
+        if hnsw_ef is None and quantization is None:
+            return None
+        return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
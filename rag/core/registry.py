@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from rag.core.metrics import metrics
+
+
+class ModelRegistry:
+    """
+    Thread-safe registry of models that are loaded on first use. Loading is
+    done once per model and process, even if several threads request the
+    same model at the same time. If `max_loaded` is given, the least
+    recently used models are evicted to keep at most that many in memory.
+    """
+
+    def __init__(self, max_loaded: Optional[int] = None):
+        self._max_loaded = max_loaded
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: OrderedDict = OrderedDict()
+        self._locks: Dict[str, Lock] = {}
+        self._lock = Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Register the function that loads a model."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks[name] = Lock()
+
+    def get(self, name: str) -> Any:
+        """Get a model, loading it if it is not loaded yet."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+
+            if name not in self._loaders:
+                raise KeyError(f"Model {name} is not registered")
+
+        with self._locks[name]:
+            with self._lock:
+                if name in self._models:
+                    return self._models[name]
+
+            with metrics.span("model_load", model=name):
+                model = self._loaders[name]()
+            with self._lock:
+                self._models[name] = model
+                while (
+                    self._max_loaded is not None
+                    and len(self._models) > self._max_loaded
+                ):
+                    self._models.popitem(last=False)
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        """Check if a model is already loaded."""
+        return name in self._models
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> None:
+        """Load the given models, or all the registered ones, ahead of
+        their first use."""
+        for name in list(names if names is not None else self._loaders):
+            self.get(name)
+
+    def evict(self, name: str) -> None:
+        """Release a loaded model. It is loaded again on its next use."""
+        with self._lock:
+            self._models.pop(name, None)
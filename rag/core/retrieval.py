@@ -0,0 +1,206 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from logging import Logger
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from qdrant_client.conversions import common_types as types
+from qdrant_client.http import models
+
+from configuration.load import config
+from rag.core.logger import logger
+from rag.core.models import Model
+from rag.core.vectordb import QdrantWrapper
+
+
+@dataclass
+class RetrievalStage:
+    """A search that contributes a ranking to the fused results. Stages
+    that take longer than `budget_ms` are dropped."""
+
+    name: str
+    search: Callable[[], List[types.ScoredPoint]]
+    budget_ms: float
+    weight: float = 1.0
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[types.ScoredPoint]],
+    k: int = config["retrieval"]["rrf_k"],
+    weights: Optional[Dict[str, float]] = None,
+) -> List[types.ScoredPoint]:
+    """Merge several rankings of points, scoring each point with the sum of
+    `weight / (k + rank)` over the rankings it appears in. The fused score
+    replaces the similarity of the points."""
+    scores: Dict[str, float] = {}
+    points: Dict[str, types.ScoredPoint] = {}
+    for name, ranking in rankings.items():
+        weight = (weights or {}).get(name, 1.0)
+        for rank, point in enumerate(ranking, start=1):
+            key = str(point.id)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+            points.setdefault(key, point)
+
+    return [
+        models.ScoredPoint(
+            id=points[key].id,
+            version=points[key].version,
+            score=score,
+            payload=points[key].payload,
+            vector=points[key].vector,
+        )
+        for key, score in sorted(
+            scores.items(), key=lambda item: item[1], reverse=True
+        )
+    ]
+
+
+class HybridRetriever:
+    """
+    Runs several retrieval stages in parallel and fuses their rankings with
+    reciprocal-rank fusion. Each stage has its own time budget and the whole
+    search a deadline: the stages that miss them are left out of the fusion
+    instead of delaying the results. An optional rescoring function can
+    reorder the fused points if there is time left before the deadline.
+
+    Every search runs its stages in threads of its own, so a dropped stage
+    that is still running cannot delay the stages of the next searches.
+    """
+
+    def __init__(
+        self,
+        deadline_ms: float = config["retrieval"]["deadline_ms"],
+        rrf_k: int = config["retrieval"]["rrf_k"],
+        logger: Logger = logger,
+    ):
+        self._deadline = deadline_ms / 1000
+        self._rrf_k = rrf_k
+        self._logger = logger
+
+    def search(
+        self,
+        stages: List[RetrievalStage],
+        top: int = 5,
+        rescore: Optional[
+            Callable[[List[types.ScoredPoint]], List[types.ScoredPoint]]
+        ] = None,
+    ) -> List[types.ScoredPoint]:
+        """Run the stages and return the `top` fused points."""
+        # One thread per stage plus one for the rescoring. Threads of the
+        # dropped stages finish in the background, without blocking this
+        # search nor holding a worker that other searches wait for.
+        executor = ThreadPoolExecutor(
+            max_workers=len(stages) + 1, thread_name_prefix="retrieval"
+        )
+        try:
+            return self._search(executor, stages, top, rescore)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _search(
+        self,
+        executor: ThreadPoolExecutor,
+        stages: List[RetrievalStage],
+        top: int,
+        rescore: Optional[
+            Callable[[List[types.ScoredPoint]], List[types.ScoredPoint]]
+        ],
+    ) -> List[types.ScoredPoint]:
+        start = time.monotonic()
+        deadline = start + self._deadline
+        futures = {
+            stage.name: executor.submit(stage.search) for stage in stages
+        }
+
+        rankings = {}
+        for stage in stages:
+            stage_deadline = min(start + stage.budget_ms / 1000, deadline)
+            try:
+                rankings[stage.name] = futures[stage.name].result(
+                    timeout=max(stage_deadline - time.monotonic(), 0)
+                )
+            except FutureTimeoutError:
+                self._logger.warning(
+                    f"Dropped retrieval stage {stage.name}, over its "
+                    f"budget of {stage.budget_ms} ms"
+                )
+            except Exception as e:
+                self._logger.warning(
+                    f"Dropped retrieval stage {stage.name}: {e}"
+                )
+
+        points = reciprocal_rank_fusion(
+            rankings,
+            k=self._rrf_k,
+            weights={stage.name: stage.weight for stage in stages},
+        )
+        if rescore is not None and points:
+            try:
+                points = executor.submit(rescore, points).result(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except FutureTimeoutError:
+                self._logger.warning("Skipped rescoring, over the deadline")
+            except Exception as e:
+                self._logger.warning(f"Skipped rescoring: {e}")
+
+        self._logger.debug(
+            f"Fused {len(rankings)} stages in "
+            f"{time.monotonic() - start:.3f}s"
+        )
+        return points[:top]
+
+
+class ZeroShotLabeler:
+    """
+    Labels audios or images with the closest of a fixed set of text labels,
+    comparing the embedding of the file with the embeddings of the labels
+    formatted with the prompt of each model, e.g. "a photo of a {}". The
+    labels are loaded with `get_labels` and their embeddings computed once
+    per model, on first use.
+    """
+
+    def __init__(
+        self,
+        qdrant_manager: QdrantWrapper,
+        get_labels: Callable[[], List[str]],
+        prompts: Optional[Dict[Model, str]] = None,
+    ):
+        self._qdrant_manager = qdrant_manager
+        self._get_labels = get_labels
+        self.prompts = prompts or {}
+        self._label_embeddings: Dict[Model, np.ndarray] = {}
+        self._lock = Lock()
+
+    def _embed_labels(self, model: Model) -> np.ndarray:
+        """Get the normalized embeddings of the labels for a model."""
+        with self._lock:
+            if model not in self._label_embeddings:
+                # The embeddings of the models are already normalized
+                self._label_embeddings[model] = np.asarray(
+                    self._qdrant_manager.embed_texts(
+                        model=model,
+                        texts=[
+                            self.prompt(model, label)
+                            for label in self._get_labels()
+                        ],
+                    ),
+                    dtype=np.float32,
+                )
+            return self._label_embeddings[model]
+
+    def prompt(self, model: Model, label: str) -> str:
+        """Format a label as a text query for the given model."""
+        return self.prompts.get(model, "{}").format(label)
+
+    def label(self, model: Model, path: str) -> str:
+        """Get the label closest to the given file."""
+        embedding = np.asarray(
+            self._qdrant_manager._compute_embeddings(model=model, value=path),
+            dtype=np.float32,
+        )
+        similarities = self._embed_labels(model) @ embedding
+        return self._get_labels()[int(np.argmax(similarities))]
@@ -0,0 +1,46 @@
+import json
+import os
+from typing import Any, Dict
+
+# Version of the layout of the exported collections
+SNAPSHOT_VERSION = 1
+
+# Files of an exported collection: the description of the collection, one
+# line of JSON with the id and payload of each point, and one `.npy`
+# matrix per vector with a row per point, in the same order as the lines
+META_FILE = "meta.json"
+POINTS_FILE = "points.jsonl"
+
+# Precisions accepted for the exported vectors
+VECTOR_DTYPES = ("float32", "float16")
+
+# Key of the unnamed vector of a collection in the description
+UNNAMED_VECTOR = ""
+
+
+def vectors_file(vector_name: str) -> str:
+    """Name of the file with the vectors of a named vector, or with the
+    unnamed vector of the collection."""
+    if vector_name == UNNAMED_VECTOR:
+        return "vectors.npy"
+    return f"vectors.{vector_name}.npy"
+
+
+def write_meta(directory: str, meta: Dict[str, Any]) -> None:
+    """Write the description of an exported collection."""
+    with open(os.path.join(directory, META_FILE), "w") as file:
+        json.dump({"version": SNAPSHOT_VERSION, **meta}, file, indent=2)
+
+
+def read_meta(directory: str) -> Dict[str, Any]:
+    """Read the description of an exported collection."""
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        raise ValueError(f"No exported collection in {directory}")
+    with open(path) as file:
+        meta = json.load(file)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported export version {meta.get('version')} in {directory}"
+        )
+    return meta
@@ -0,0 +1,101 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from rag.core.cache import file_digest, point_id_from_digest
+from rag.core.data import DataToUpsert
+
+
+class Manifest:
+    """
+    Local record of the files ingested in each collection, with the
+    modification time, size and content digest of every file. It lets the
+    sync skip hashing files that did not change since the last run.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._collections: Dict[str, Dict[str, dict]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self._collections = json.load(file)
+
+    def entries(self, collection_name: str) -> Dict[str, dict]:
+        """Get the files recorded for a collection."""
+        return self._collections.get(collection_name, {})
+
+    def update(self, collection_name: str, entries: Dict[str, dict]) -> None:
+        """Replace the files recorded for a collection and save the
+        manifest to disk."""
+        self._collections[collection_name] = entries
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        temporary_path = f"{self._path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self._collections, file)
+        os.replace(temporary_path, self._path)
+
+
+@dataclass
+class SyncPlan:
+    """Changes needed to bring a collection in line with a directory."""
+
+    to_upsert: List[DataToUpsert] = field(default_factory=list)
+    to_delete: List[str] = field(default_factory=list)
+    entries: Dict[str, dict] = field(default_factory=dict)
+
+
+def plan_sync(
+    directory: str,
+    file_extension: str,
+    payload_generator: Callable[[str], Dict[str, str]],
+    manifest_entries: Dict[str, dict],
+    existing_points: Dict[str, str],
+) -> SyncPlan:
+    """Compare the files in a directory with the manifest and the points in
+    the collection (id to filename). Files are only hashed if their mtime
+    or size changed since they were recorded in the manifest."""
+    plan = SyncPlan()
+    filenames_by_id: Dict[str, List[str]] = {}
+
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(file_extension):
+            continue
+
+        stat = os.stat(os.path.join(directory, file))
+        entry = manifest_entries.get(file)
+        if (
+            entry is None
+            or entry["mtime"] != stat.st_mtime
+            or entry["size"] != stat.st_size
+        ):
+            entry = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "digest": file_digest(os.path.join(directory, file)),
+            }
+        plan.entries[file] = entry
+
+        point_id = point_id_from_digest(entry["digest"])
+        filenames_by_id.setdefault(point_id, []).append(file)
+
+    # Files with the same content share a point, so a point is up to date
+    # if its payload points to any of them
+    for point_id, filenames in filenames_by_id.items():
+        if existing_points.get(point_id) not in filenames:
+            file = filenames[0]
+            plan.to_upsert.append(
+                DataToUpsert(
+                    value=os.path.join(directory, file),
+                    payload=payload_generator(file),
+                    digest=plan.entries[file]["digest"],
+                )
+            )
+
+    plan.to_delete = [
+        point_id
+        for point_id in existing_points
+        if point_id not in filenames_by_id
+    ]
+
+    return plan
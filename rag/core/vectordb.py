@@ -1,16 +1,90 @@
+import asyncio
+import json
 import os
-import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import partial
+from itertools import islice
 from logging import Logger
-from typing import Callable, Dict, List, Tuple
+from threading import Lock, Thread
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from qdrant_client import QdrantClient
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.conversions import common_types as types
 from qdrant_client.http import models
 
 from configuration.load import config
-from rag.core.data import DataToUpsert
+from rag.core import snapshot
+from rag.core.batching import EmbeddingService
+from rag.core.cache import (
+    EmbeddingCache,
+    QueryEmbeddingCache,
+    file_digest,
+    point_id_from_digest,
+    segment_digest,
+)
+from rag.core.data import DataToUpsert, batched
 from rag.core.logger import logger
-from rag.core.models import Modalities, Model
+from rag.core.metrics import metrics
+from rag.core.models import Modalities, Model, caption_model_id, model_ids
+from rag.core.preprocessing import iter_audio_windows
+from rag.core.profiles import CollectionProfile
+
+# Counters of the cache lookups and of the points written to Qdrant
+query_cache_requests = metrics.counter(
+    "rag_query_cache_requests_total", "Lookups in the query embedding cache"
+)
+embedding_cache_requests = metrics.counter(
+    "rag_embedding_cache_requests_total", "Lookups in the embedding cache"
+)
+upserted_points = metrics.counter(
+    "rag_upserted_points_total", "Points upserted to Qdrant"
+)
+
+# Values accepted by the search filters: a value to match exactly or a list
+# of values to match any of them
+FilterValue = Union[str, int, bool, List[Union[str, int]]]
+
+
+def build_filter(
+    filters: Optional[Dict[str, FilterValue]],
+) -> Optional[models.Filter]:
+    """Build a Qdrant filter that requires every payload field to match the
+    given value, or any of the values if a list is given."""
+    if not filters:
+        return None
+
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key=key,
+                match=(
+                    models.MatchAny(any=value)
+                    if isinstance(value, list)
+                    else models.MatchValue(value=value)
+                ),
+            )
+            for key, value in filters.items()
+        ]
+    )
+
+
+def is_embedded(client: QdrantClient) -> bool:
+    """Check if a client runs the embedded Qdrant engine of the process,
+    in memory or in a local folder, instead of connecting to a server."""
+    options = client.init_options
+    return options["path"] is not None or options["location"] == ":memory:"
 
 
 class QdrantWrapper:
@@ -26,17 +100,46 @@ class QdrantWrapper:
         Model.CLIP: config["vectordb"]["collection_image"],
     }
 
+    # Model of each named vector of the multimodal collection
+    vector_models = {
+        "clap": Model.CLAP,
+        "clip": Model.CLIP,
+        "clip_caption": Model.CLIP,
+    }
+
+    # Named vector with the text embedding of the caption of each file
+    caption_vector = "clip_caption"
+
     def __init__(
         self,
         client: QdrantClient,
         embedding_function_audios: Callable,
         embedding_function_images: Callable,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        profile: Optional[CollectionProfile] = None,
         logger: Logger = logger,
     ):
         self._client = client
+        self.profile = profile or CollectionProfile(name="default")
         self._embeddings_function_audio = embedding_function_audios
         self._embeddings_function_image = embedding_function_images
+        self._query_cache = query_cache
+        self._embedding_service = embedding_service
         self._logger = logger
+        # The embedded engine is not thread-safe, so its writes are run one
+        # at a time when they come from several threads
+        self._write_lock = Lock() if is_embedded(client) else nullcontext()
+
+    @staticmethod
+    def get_model(
+        collection_name: str, vector_name: Optional[str] = None
+    ) -> Model:
+        """Get the model of a named vector, or of the unnamed vector of a
+        collection if no vector name is given."""
+        if vector_name is not None:
+            return QdrantWrapper.vector_models[vector_name]
+        return QdrantWrapper.collection_models[collection_name]
 
     def delete_collection(self, collection_name: str) -> None:
         """Delete a collection of vectors in Qdrant."""
@@ -45,13 +148,45 @@ class QdrantWrapper:
     def create_collection(
         self,
         collection_name: str,
-        vectors_config: Dict[str, models.VectorParams],
+        vectors_config: Union[
+            models.VectorParams, Dict[str, models.VectorParams]
+        ],
+        payload_indexes: List[str] = config["vectordb"]["payload_indexes"],
     ) -> None:
-        """Create a collection of vectors in Qdrant."""
+        """Create a collection of vectors in Qdrant, with keyword indexes
+        for the given payload fields. A dict of vector parameters creates
+        a collection with named vectors. The index, quantization and
+        sharding settings come from the collection profile."""
         self._client.create_collection(
-            collection_name=collection_name, vectors_config=vectors_config
+            collection_name=collection_name,
+            vectors_config=vectors_config,
+            hnsw_config=self.profile.hnsw_config(),
+            quantization_config=self.profile.quantization_config(),
+            optimizers_config=self.profile.optimizers_config(),
+            shard_number=self.profile.shard_number,
+        )
+        self._logger.info(
+            f"Created collection {collection_name} in Qdrant "
+            f"with profile {self.profile.name}"
+        )
+        self.create_payload_indexes(collection_name, payload_indexes)
+
+    def create_payload_indexes(
+        self,
+        collection_name: str,
+        fields: List[str] = config["vectordb"]["payload_indexes"],
+    ) -> None:
+        """Create keyword indexes for payload fields, so filtered searches
+        on them are resolved by Qdrant."""
+        for field in fields:
+            self._client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=models.PayloadSchemaType.KEYWORD,
+            )
+        self._logger.info(
+            f"Created payload indexes for {fields} in {collection_name}"
         )
-        self._logger.info(f"Created collection {collection_name} in Qdrant")
 
     def check_collection(self, collection_name: str) -> bool:
         """Check if a collection exists in Qdrant."""
@@ -59,25 +194,120 @@ class QdrantWrapper:
             collection_name=collection_name
         )
 
-    def _compute_embeddings(self, model: str, value: str) -> List[float]:
-        """Compute embeddings for the given value."""
+    def get_point_filenames(
+        self, collection_name: str, page_size: int = 1000
+    ) -> Dict[str, str]:
+        """Get the filename in the payload of every point of a collection,
+        indexed by point id."""
+        filenames, offset = {}, None
+        while True:
+            points, offset = self._client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=["filename"],
+                with_vectors=False,
+            )
+            for point in points:
+                filenames[str(point.id)] = point.payload.get("filename")
+            if offset is None:
+                return filenames
+
+    def delete_vectors(self, collection_name: str, ids: List[str]) -> None:
+        """Delete the points with the given ids from a collection."""
+        if not ids:
+            return
+        self._client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=ids),
+        )
+        self._logger.info(
+            f"Deleted {len(ids)} points from collection {collection_name}"
+        )
+
+    def delete_other_points(
+        self, collection_name: str, filename: str, keep_ids: List[str]
+    ) -> None:
+        """Delete the points of a file except the ones with the given ids,
+        e.g. stale segments of the file."""
+        with self._write_lock:
+            self._client.delete(
+                collection_name=collection_name,
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(
+                        must=[
+                            models.FieldCondition(
+                                key="filename",
+                                match=models.MatchValue(value=filename),
+                            )
+                        ],
+                        must_not=[models.HasIdCondition(has_id=keep_ids)],
+                    )
+                ),
+            )
+
+    def _compute_embeddings(self, model: Model, value: str) -> np.ndarray:
+        """Compute embeddings for the given value. Embeddings of text
+        queries are served from the query cache when possible."""
         embedding, embedding_type = None, None
 
-        if model == Model.CLAP:
-            embedding, embedding_type = self._compute_clap_embeddings(value)
+        is_text = not os.path.exists(value)
+        if is_text and self._query_cache is not None:
+            embedding = self._query_cache.get(model, value)
+            query_cache_requests.inc(
+                result="miss" if embedding is None else "hit"
+            )
+            if embedding is not None:
+                return embedding
+
+        with metrics.span("embed_query", model=model.value):
+            if self._embedding_service is not None:
+                embedding, embedding_type = self._compute_service_embeddings(
+                    model=model, value=value, is_text=is_text
+                )
+            elif model == Model.CLAP:
+                embedding, embedding_type = self._compute_clap_embeddings(
+                    value
+                )
+            elif model == Model.CLIP:
+                embedding, embedding_type = self._compute_clip_embeddings(
+                    value
+                )
+            else:
+                raise ValueError(f"Unsupported model type: {model}")
+
+        self._logger.debug(
+            "Computed %s embeddings for %s", embedding_type, value
+        )
+        if is_text and self._query_cache is not None:
+            self._query_cache.put(model, value, embedding)
+
+        return embedding
+
+    def _compute_service_embeddings(
+        self, model: Model, value: str, is_text: bool
+    ) -> Tuple[np.ndarray, str]:
+        """Compute embeddings through the micro-batching service, so
+        concurrent requests share a forward pass."""
+        if is_text:
+            modality = Modalities.TEXT
+        elif model == Model.CLAP:
+            modality = Modalities.AUDIO
         elif model == Model.CLIP:
-            embedding, embedding_type = self._compute_clip_embeddings(value)
+            modality = Modalities.IMAGE
         else:
             raise ValueError(f"Unsupported model type: {model}")
 
-        self._logger.info(
-            f"Computing {embedding_type} embeddings for {value}"
+        return (
+            self._embedding_service.embed(
+                model=model, modality=modality, value=value
+            ),
+            modality.value,
         )
-        return embedding
 
     def _compute_clap_embeddings(
         self, value: str
-    ) -> Tuple[List[float], str]:
+    ) -> Tuple[np.ndarray, str]:
         if os.path.exists(value):
             return (
                 self._embeddings_function_audio(
@@ -95,7 +325,7 @@ class QdrantWrapper:
 
     def _compute_clip_embeddings(
         self, value: str
-    ) -> Tuple[List[float], str]:
+    ) -> Tuple[np.ndarray, str]:
         if os.path.exists(value):
             return (
                 self._embeddings_function_image(
@@ -111,45 +341,803 @@ class QdrantWrapper:
                 "text",
             )
 
-    def _create_point_for_qdrant(
-        self, model: Model, data: DataToUpsert
-    ) -> models.PointStruct:
-        """Create a list of points for upserting in Qdrant."""
-        self._logger.info(f"Creating embeddings for {data.value}")
-        embedding = self._compute_embeddings(model=model, value=data.value)
+    def _compute_embeddings_batch(
+        self, model: Model, values: List[str]
+    ) -> np.ndarray:
+        """Compute embeddings for a list of files in a single forward pass."""
+        if model == Model.CLAP:
+            return self._embeddings_function_audio(
+                modality=Modalities.AUDIO, audio_paths=values, batch=True
+            )
+        elif model == Model.CLIP:
+            return self._embeddings_function_image(
+                modality=Modalities.IMAGE, image_paths=values, batch=True
+            )
+        else:
+            raise ValueError(f"Unsupported model type: {model}")
+
+    def embed_texts(
+        self, model: Model, texts: List[str]
+    ) -> np.ndarray:
+        """Compute embeddings for a list of texts in a single forward
+        pass."""
+        if model == Model.CLAP:
+            return self._embeddings_function_audio(
+                modality=Modalities.TEXT, texts_list=texts, batch=True
+            )
+        elif model == Model.CLIP:
+            return self._embeddings_function_image(
+                modality=Modalities.TEXT, texts_list=texts, batch=True
+            )
+        else:
+            raise ValueError(f"Unsupported model type: {model}")
 
-        return models.PointStruct(
-            id=str(uuid.uuid4()),
-            payload=data.payload,
-            vector=embedding,
+    def _compute_embeddings_cached(
+        self,
+        model: Model,
+        data: List[DataToUpsert],
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ) -> np.ndarray:
+        """Compute embeddings for a list of files, reusing the ones stored
+        in the cache for files with the same content."""
+        for item in data:
+            item.digest = item.digest or file_digest(item.value)
+
+        embeddings = {}
+        if embedding_cache is not None:
+            embeddings = embedding_cache.get_many(
+                model_ids[model], [item.digest for item in data]
+            )
+
+        missing = [item for item in data if item.digest not in embeddings]
+        embedding_cache_requests.inc(len(data) - len(missing), result="hit")
+        embedding_cache_requests.inc(len(missing), result="miss")
+        self._logger.debug(
+            "Creating embeddings for %d files, %d found in cache",
+            len(missing),
+            len(data) - len(missing),
+        )
+        if missing:
+            with metrics.span("embed_batch", model=model.value):
+                computed = self._compute_embeddings_batch(
+                    model=model, values=[item.value for item in missing]
+                )
+            computed = {
+                item.digest: embedding
+                for item, embedding in zip(missing, computed)
+            }
+            if embedding_cache is not None:
+                embedding_cache.put_many(model_ids[model], computed)
+            embeddings.update(computed)
+
+        return np.stack([embeddings[item.digest] for item in data])
+
+    def caption_points(
+        self,
+        data: List[DataToUpsert],
+        caption_function: Callable[[List[str]], List[str]],
+        vector_name: Optional[str] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ) -> Optional[np.ndarray]:
+        """Caption a batch of files and add the captions to their payload,
+        reusing the captions stored in the cache for files with the same
+        content. If the points have named vectors, the captions are also
+        embedded to be stored as the caption vector, and these embeddings
+        are returned."""
+        for item in data:
+            item.digest = item.digest or file_digest(item.value)
+
+        captions = {}
+        if embedding_cache is not None:
+            captions = embedding_cache.get_captions(
+                caption_model_id, [item.digest for item in data]
+            )
+
+        missing = [item for item in data if item.digest not in captions]
+        if missing:
+            with metrics.span("caption_batch"):
+                computed = caption_function([item.value for item in missing])
+            computed = {
+                item.digest: caption
+                for item, caption in zip(missing, computed)
+            }
+            if embedding_cache is not None:
+                embedding_cache.put_captions(caption_model_id, computed)
+            captions.update(computed)
+
+        captions = [captions[item.digest] for item in data]
+        for item, caption in zip(data, captions):
+            item.payload = {**(item.payload or {}), "caption": caption}
+
+        if vector_name is None:
+            return None
+        return self.embed_texts(
+            model=QdrantWrapper.vector_models[QdrantWrapper.caption_vector],
+            texts=captions,
+        )
+
+    def _create_points_for_qdrant(
+        self,
+        data: List[DataToUpsert],
+        embeddings: np.ndarray,
+        vector_name: Optional[str] = None,
+        caption_embeddings: Optional[np.ndarray] = None,
+    ) -> List[models.PointStruct]:
+        """Create a list of points for upserting in Qdrant. The ids are
+        derived from the content of the files, so they are stable across
+        runs. If `vector_name` is given, the embeddings are stored as that
+        named vector, next to the caption vector if its embeddings are
+        given."""
+        # The float32 arrays are converted to the lists of the client in a
+        # single call per batch, instead of per element
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        if caption_embeddings is not None:
+            caption_embeddings = np.asarray(
+                caption_embeddings, dtype=np.float32
+            ).tolist()
+
+        points = []
+        for index, (item, embedding) in enumerate(zip(data, embeddings)):
+            vector = embedding
+            if vector_name is not None:
+                vector = {vector_name: embedding}
+                if caption_embeddings is not None:
+                    vector[QdrantWrapper.caption_vector] = caption_embeddings[
+                        index
+                    ]
+            points.append(
+                models.PointStruct(
+                    id=point_id_from_digest(
+                        item.digest or file_digest(item.value)
+                    ),
+                    payload=item.payload,
+                    vector=vector,
+                )
+            )
+        return points
+
+    def upsert_points(
+        self,
+        collection_name: str,
+        data: List[DataToUpsert],
+        embeddings: np.ndarray,
+        vector_name: Optional[str] = None,
+        caption_embeddings: Optional[np.ndarray] = None,
+    ) -> None:
+        """Upsert already computed embeddings to a collection in Qdrant
+        using a single request."""
+        points = self._create_points_for_qdrant(
+            data=data,
+            embeddings=embeddings,
+            vector_name=vector_name,
+            caption_embeddings=caption_embeddings,
+        )
+        with metrics.span(
+            "upsert", collection=collection_name
+        ), self._write_lock:
+            self._client.upsert(
+                collection_name=collection_name, points=points
+            )
+        upserted_points.inc(len(points), collection=collection_name)
+        self._logger.debug(
+            "Upserted %d points to Qdrant: %s",
+            len(points),
+            data[-1].payload["filename"],
         )
 
     def upsert_vectors(
-        self, collection_name: str, data_to_upsert: List[DataToUpsert]
+        self,
+        collection_name: str,
+        data_to_upsert: Iterable[DataToUpsert],
+        batch_size: int = config["ingest"]["batch_size"],
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vector_name: Optional[str] = None,
+        caption_function: Optional[Callable[[List[str]], List[str]]] = None,
     ) -> None:
-        """Upsert vectors to a collection in Qdrant."""
-        for data in data_to_upsert:
-            point = self._create_point_for_qdrant(
-                model=QdrantWrapper.collection_models[collection_name],
-                data=data,
+        """Upsert vectors to a collection in Qdrant. The files are embedded
+        and sent to Qdrant in batches of `batch_size` points. If
+        `vector_name` is given, they are stored as that named vector. If
+        `caption_function` is given, the files are also captioned (see
+        `caption_points`)."""
+        model = QdrantWrapper.get_model(collection_name, vector_name)
+        for batch in batched(data_to_upsert, batch_size):
+            embeddings = self._compute_embeddings_cached(
+                model=model, data=batch, embedding_cache=embedding_cache
             )
-            self._client.upsert(
-                collection_name=collection_name, points=[point]
+            caption_embeddings = None
+            if caption_function is not None:
+                caption_embeddings = self.caption_points(
+                    data=batch,
+                    caption_function=caption_function,
+                    vector_name=vector_name,
+                    embedding_cache=embedding_cache,
+                )
+            self.upsert_points(
+                collection_name=collection_name,
+                data=batch,
+                embeddings=embeddings,
+                vector_name=vector_name,
+                caption_embeddings=caption_embeddings,
             )
-            self._logger.info(
-                f"Upserted data to Qdrant: {data.payload['filename']}"
+
+    def upsert_segments(
+        self,
+        collection_name: str,
+        data_to_upsert: Iterable[DataToUpsert],
+        embedding_function: Callable[[Model, np.ndarray], np.ndarray],
+        window_seconds: float,
+        hop_seconds: Optional[float] = None,
+        batch_size: int = config["ingest"]["batch_size"],
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vector_name: Optional[str] = None,
+    ) -> None:
+        """Upsert one point per window of each audio file, with the offsets
+        of the window in seconds in the payload (`start` and `end`). The
+        windows are streamed from disk and embedded in batches, so memory
+        stays bounded no matter how long the files are. Once the segments
+        of a file are stored, its other points are deleted, i.e. the point
+        of the whole file and segments of a previous segmentation."""
+        model = QdrantWrapper.get_model(collection_name, vector_name)
+        hop_seconds = hop_seconds or window_seconds
+        model_id = f"{model_ids[model]}@{window_seconds}s/{hop_seconds}s"
+        for data in data_to_upsert:
+            data.digest = data.digest or file_digest(data.value)
+            windows = iter_audio_windows(
+                data.value,
+                window_seconds=window_seconds,
+                hop_seconds=hop_seconds,
+            )
+            segment_ids = []
+            for batch in batched(enumerate(windows), batch_size):
+                segments = [
+                    DataToUpsert(
+                        value=data.value,
+                        payload={
+                            **data.payload,
+                            "segment": index,
+                            "start": start,
+                            "end": end,
+                        },
+                        digest=segment_digest(
+                            data.digest, index, window_seconds, hop_seconds
+                        ),
+                    )
+                    for index, (start, end, _) in batch
+                ]
+                embeddings = {}
+                if embedding_cache is not None:
+                    embeddings = embedding_cache.get_many(
+                        model_id, [segment.digest for segment in segments]
+                    )
+
+                missing = [
+                    (segment, waveform)
+                    for segment, (_, (_, _, waveform)) in zip(segments, batch)
+                    if segment.digest not in embeddings
+                ]
+                if missing:
+                    computed = embedding_function(
+                        model, np.stack([waveform for _, waveform in missing])
+                    )
+                    computed = {
+                        segment.digest: embedding
+                        for (segment, _), embedding in zip(missing, computed)
+                    }
+                    if embedding_cache is not None:
+                        embedding_cache.put_many(model_id, computed)
+                    embeddings.update(computed)
+
+                self.upsert_points(
+                    collection_name=collection_name,
+                    data=segments,
+                    embeddings=[
+                        embeddings[segment.digest] for segment in segments
+                    ],
+                    vector_name=vector_name,
+                )
+                segment_ids.extend(
+                    point_id_from_digest(segment.digest)
+                    for segment in segments
+                )
+
+            self.delete_other_points(
+                collection_name=collection_name,
+                filename=data.payload["filename"],
+                keep_ids=segment_ids,
             )
 
     def search_vectors(
-        self, collection_name: str, value: str, top: int = 5
+        self,
+        collection_name: str,
+        value: str,
+        top: int = 5,
+        filters: Optional[Dict[str, FilterValue]] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
     ) -> List[types.ScoredPoint]:
-        """Search for vectors in Qdrant."""
+        """Search for vectors in Qdrant, optionally restricted to the points
+        whose payload matches the filters. `hnsw_ef` and `oversampling`
+        override the search settings of the collection profile."""
         embedding = self._compute_embeddings(
-            model=QdrantWrapper.collection_models[collection_name],
+            model=QdrantWrapper.get_model(collection_name),
             value=value,
         )
-        return self._client.search(
-            collection_name=collection_name,
-            query_vector=embedding,
-            limit=top,
+        with metrics.span("search", collection=collection_name):
+            return self._client.search(
+                collection_name=collection_name,
+                query_vector=embedding,
+                query_filter=build_filter(filters),
+                search_params=self.profile.search_params(
+                    hnsw_ef=hnsw_ef, oversampling=oversampling
+                ),
+                limit=top,
+            )
+
+    def _compute_embeddings_many(
+        self, model: Model, values: List[str]
+    ) -> np.ndarray:
+        """Compute embeddings for several queries, texts or files, with one
+        forward pass per modality. Text embeddings are served from the
+        query cache when possible."""
+        embeddings: Dict[int, np.ndarray] = {}
+        texts, files = [], []
+        for index, value in enumerate(values):
+            if os.path.exists(value):
+                files.append(index)
+                continue
+
+            embedding = None
+            if self._query_cache is not None:
+                embedding = self._query_cache.get(model, value)
+                query_cache_requests.inc(
+                    result="miss" if embedding is None else "hit"
+                )
+            if embedding is not None:
+                embeddings[index] = embedding
+            else:
+                texts.append(index)
+
+        with metrics.span("embed_query_batch", model=model.value):
+            if texts:
+                computed = self.embed_texts(
+                    model=model, texts=[values[index] for index in texts]
+                )
+                for index, embedding in zip(texts, computed):
+                    embeddings[index] = embedding
+                    if self._query_cache is not None:
+                        self._query_cache.put(model, values[index], embedding)
+            if files:
+                computed = self._compute_embeddings_batch(
+                    model=model, values=[values[index] for index in files]
+                )
+                embeddings.update(zip(files, computed))
+
+        return np.stack([embeddings[index] for index in range(len(values))])
+
+    def search_vectors_batch(
+        self,
+        collection_name: str,
+        values: List[str],
+        top: int = 5,
+        filters: Optional[Dict[str, FilterValue]] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+    ) -> List[List[types.ScoredPoint]]:
+        """Search for several values at once: they are embedded in a single
+        forward pass per modality and searched with a single request to
+        Qdrant. The results are returned in the same order as the
+        values."""
+        if not values:
+            return []
+
+        embeddings = self._compute_embeddings_many(
+            model=QdrantWrapper.get_model(collection_name), values=values
+        )
+        query_filter = build_filter(filters)
+        search_params = self.profile.search_params(
+            hnsw_ef=hnsw_ef, oversampling=oversampling
+        )
+        requests = [
+            models.SearchRequest(
+                vector=embedding.tolist(),
+                filter=query_filter,
+                params=search_params,
+                limit=top,
+                with_payload=True,
+            )
+            for embedding in embeddings
+        ]
+        with metrics.span("search_batch", collection=collection_name):
+            return self._client.search_batch(
+                collection_name=collection_name, requests=requests
+            )
+
+    def search_named_vectors(
+        self,
+        collection_name: str,
+        value: str,
+        vector_names: List[str],
+        top: int = 5,
+        filters: Optional[Dict[str, FilterValue]] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+    ) -> Dict[str, List[types.ScoredPoint]]:
+        """Search several named vectors of a collection with the same value
+        in a single request to Qdrant. The value is embedded once per model,
+        so a file can only be searched in the vectors of its own model,
+        while a text can be searched in all of them. The results are
+        returned by vector name."""
+        embeddings = {}
+        for vector_name in vector_names:
+            model = QdrantWrapper.vector_models[vector_name]
+            if model not in embeddings:
+                embeddings[model] = self._compute_embeddings(
+                    model=model, value=value
+                )
+
+        query_filter = build_filter(filters)
+        search_params = self.profile.search_params(
+            hnsw_ef=hnsw_ef, oversampling=oversampling
+        )
+        requests = [
+            models.SearchRequest(
+                vector=models.NamedVector(
+                    name=vector_name,
+                    vector=embeddings[
+                        QdrantWrapper.vector_models[vector_name]
+                    ].tolist(),
+                ),
+                filter=query_filter,
+                params=search_params,
+                limit=top,
+                with_payload=True,
+            )
+            for vector_name in vector_names
+        ]
+        with metrics.span("search", collection=collection_name):
+            results = self._client.search_batch(
+                collection_name=collection_name, requests=requests
+            )
+        return dict(zip(vector_names, results))
+
+    def rescore_points(
+        self,
+        collection_name: str,
+        points: List[types.ScoredPoint],
+        values: List[str],
+    ) -> List[types.ScoredPoint]:
+        """Score again the given points of a collection with the mean cosine
+        similarity between their stored vectors and the embeddings of the
+        values, e.g. the texts searched by the stages of a fused search, and
+        sort them by that score. Points missing from the collection keep
+        their order, after the rescored ones."""
+        if not points or not values:
+            return points
+
+        queries = self._compute_embeddings_many(
+            model=QdrantWrapper.get_model(collection_name), values=values
+        )
+        with metrics.span("rescore", collection=collection_name):
+            records = self._client.retrieve(
+                collection_name=collection_name,
+                ids=[point.id for point in points],
+                with_payload=False,
+                with_vectors=True,
+            )
+        vectors = {str(record.id): record.vector for record in records}
+
+        rescored, missing = [], []
+        for point in points:
+            vector = vectors.get(str(point.id))
+            if vector is None:
+                missing.append(point)
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            # The vectors of cosine collections are stored normalized
+            score = float(np.mean(queries @ vector))
+            rescored.append(point.model_copy(update={"score": score}))
+        rescored.sort(key=lambda point: point.score, reverse=True)
+        return rescored + missing
+
+    def export_collection(
+        self,
+        collection_name: str,
+        directory: str,
+        dtype: str = config["snapshots"]["dtype"],
+        page_size: int = config["snapshots"]["batch_size"],
+    ) -> int:
+        """Export the ids, payloads and vectors of every point of a
+        collection to a directory, with the vectors as `.npy` matrices of
+        `dtype` (float32 or float16). Named vectors missing in a point are
+        stored as rows of NaN. Return the number of exported points."""
+        if dtype not in snapshot.VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        params = self._client.get_collection(collection_name).config.params
+        named = isinstance(params.vectors, dict)
+        vectors_params = (
+            params.vectors
+            if named
+            else {snapshot.UNNAMED_VECTOR: params.vectors}
+        )
+        count = self._client.count(
+            collection_name=collection_name, exact=True
+        ).count
+
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            name: np.lib.format.open_memmap(
+                os.path.join(directory, snapshot.vectors_file(name)),
+                mode="w+",
+                dtype=dtype,
+                shape=(count, vector_params.size),
+            )
+            for name, vector_params in vectors_params.items()
+        }
+        if named:
+            for array in arrays.values():
+                array[:] = np.nan
+
+        index, offset = 0, None
+        points_path = os.path.join(directory, snapshot.POINTS_FILE)
+        with metrics.span("export", collection=collection_name), open(
+            points_path, "w"
+        ) as file:
+            while index < count:
+                points, offset = self._client.scroll(
+                    collection_name=collection_name,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+                # Points added while exporting do not fit in the matrices
+                for point in points[: count - index]:
+                    vectors = (
+                        point.vector
+                        if named
+                        else {snapshot.UNNAMED_VECTOR: point.vector}
+                    )
+                    for name, vector in vectors.items():
+                        arrays[name][index] = vector
+                    file.write(
+                        json.dumps({"id": point.id, "payload": point.payload})
+                        + "\n"
+                    )
+                    index += 1
+                if offset is None:
+                    break
+
+        for array in arrays.values():
+            array.flush()
+        snapshot.write_meta(
+            directory,
+            {
+                "collection": collection_name,
+                "count": index,
+                "dtype": dtype,
+                "named": named,
+                "vectors": {
+                    name: {
+                        "size": vector_params.size,
+                        "distance": vector_params.distance.value,
+                    }
+                    for name, vector_params in vectors_params.items()
+                },
+            },
+        )
+        self._logger.info(
+            f"Exported {index} points of {collection_name} to {directory}"
         )
+        return index
+
+    def _import_points(
+        self,
+        collection_name: str,
+        arrays: Dict[str, np.ndarray],
+        named: bool,
+        start: int,
+        lines: List[str],
+    ) -> int:
+        """Upsert the points of an exported collection whose ids and
+        payloads are `lines` and whose vectors are the rows of the arrays
+        from `start`."""
+        vectors = {
+            name: array[start : start + len(lines)].astype(np.float32)
+            for name, array in arrays.items()
+        }
+        points = []
+        for index, line in enumerate(lines):
+            record = json.loads(line)
+            vector = {
+                name: rows[index].tolist()
+                for name, rows in vectors.items()
+                if not np.isnan(rows[index, 0])
+            }
+            points.append(
+                models.PointStruct(
+                    id=record["id"],
+                    payload=record["payload"],
+                    vector=(
+                        vector if named else vector[snapshot.UNNAMED_VECTOR]
+                    ),
+                )
+            )
+        with self._write_lock:
+            self._client.upsert(
+                collection_name=collection_name, points=points
+            )
+        upserted_points.inc(len(points), collection=collection_name)
+        return len(points)
+
+    def import_collection(
+        self,
+        directory: str,
+        collection_name: Optional[str] = None,
+        batch_size: int = config["snapshots"]["batch_size"],
+        num_workers: int = config["snapshots"]["workers"],
+    ) -> int:
+        """Import a collection exported with `export_collection`, by
+        default with its original name. The collection is created with the
+        current profile if it does not exist, and the points are upserted
+        in batches of `batch_size` by `num_workers` threads. Return the
+        number of imported points."""
+        meta = snapshot.read_meta(directory)
+        collection_name = collection_name or meta["collection"]
+        named = meta["named"]
+
+        if not self.check_collection(collection_name):
+            vectors_config = {
+                name: self.profile.vectors_config(
+                    size=params["size"],
+                    distance=models.Distance(params["distance"]),
+                )
+                for name, params in meta["vectors"].items()
+            }
+            self.create_collection(
+                collection_name=collection_name,
+                vectors_config=(
+                    vectors_config
+                    if named
+                    else vectors_config[snapshot.UNNAMED_VECTOR]
+                ),
+            )
+
+        arrays = {
+            name: np.load(
+                os.path.join(directory, snapshot.vectors_file(name)),
+                mmap_mode="r",
+            )
+            for name in meta["vectors"]
+        }
+
+        imported = 0
+        points_path = os.path.join(directory, snapshot.POINTS_FILE)
+        with metrics.span("import", collection=collection_name), open(
+            points_path
+        ) as file, ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # Keep a bounded number of batches in memory
+            pending = set()
+            lines = islice(file, meta["count"])
+            for start, batch in enumerate(batched(lines, batch_size)):
+                pending.add(
+                    executor.submit(
+                        self._import_points,
+                        collection_name,
+                        arrays,
+                        named,
+                        start * batch_size,
+                        batch,
+                    )
+                )
+                if len(pending) >= 2 * num_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    imported += sum(future.result() for future in done)
+            imported += sum(future.result() for future in pending)
+
+        self._logger.info(
+            f"Imported {imported} points from {directory} "
+            f"to {collection_name}"
+        )
+        return imported
+
+
+class AsyncQdrantWrapper:
+    """
+    Async counterpart of `QdrantWrapper` for searches, built on the async
+    Qdrant client. Embeddings are computed in worker threads by the given
+    `QdrantWrapper`, so its query cache and embedding service are shared,
+    while the searches run concurrently on the event loop. Without an async
+    client, the whole search runs in a worker thread through the given
+    `QdrantWrapper`, e.g. with the embedded local backend.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncQdrantClient],
+        qdrant_manager: QdrantWrapper,
+        logger: Logger = logger,
+    ):
+        self._client = client
+        self._qdrant_manager = qdrant_manager
+        self._logger = logger
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = Lock()
+
+    async def search_vectors(
+        self,
+        collection_name: str,
+        value: str,
+        top: int = 5,
+        filters: Optional[Dict[str, FilterValue]] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+    ) -> List[types.ScoredPoint]:
+        """Search for vectors in Qdrant, optionally restricted to the points
+        whose payload matches the filters. `hnsw_ef` and `oversampling`
+        override the search settings of the collection profile."""
+        if self._client is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None,
+                partial(
+                    self._qdrant_manager.search_vectors,
+                    collection_name=collection_name,
+                    value=value,
+                    top=top,
+                    filters=filters,
+                    hnsw_ef=hnsw_ef,
+                    oversampling=oversampling,
+                ),
+            )
+
+        embedding = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self._qdrant_manager._compute_embeddings,
+            QdrantWrapper.get_model(collection_name),
+            value,
+        )
+        with metrics.span("search", collection=collection_name):
+            return await self._client.search(
+                collection_name=collection_name,
+                query_vector=embedding,
+                query_filter=build_filter(filters),
+                search_params=self._qdrant_manager.profile.search_params(
+                    hnsw_ef=hnsw_ef, oversampling=oversampling
+                ),
+                limit=top,
+            )
+
+    async def search_many(
+        self,
+        queries: List[Tuple[str, str]],
+        top: int = 5,
+        filters: Optional[Dict[str, FilterValue]] = None,
+    ) -> List[List[types.ScoredPoint]]:
+        """Run several searches, given as (collection name, value) pairs,
+        concurrently. The results are returned in the same order."""
+        return await asyncio.gather(
+            *(
+                self.search_vectors(
+                    collection_name=collection_name,
+                    value=value,
+                    top=top,
+                    filters=filters,
+                )
+                for collection_name, value in queries
+            )
+        )
+
+    def run(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        """Run a coroutine from synchronous code and wait for its result.
+        All the coroutines run on the same background event loop, which
+        owns the connections of the async client."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                Thread(
+                    target=self._loop.run_forever,
+                    name="qdrant-async-loop",
+                    daemon=True,
+                ).start()
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
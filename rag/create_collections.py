@@ -1,8 +1,10 @@
 import argparse
 
-from rag import create_collections
+from configuration.load import config
+from rag import create_collections, create_multimodal_collection
 from rag.clients import qdrant_manager
 from rag.core.models import MODEL_AUDIO_DIM, MODEL_IMAGE_DIM, Model
+from rag.core.profiles import CollectionProfile
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Create collections")
@@ -10,11 +12,20 @@ if __name__ == "__main__":
         "-c",
         "--collection",
         type=str,
-        help="Select the collection to create: audio or image",
-        choices=["audio", "image", "both"],
+        help="Select the collection to create: audio, image or multimodal",
+        choices=["audio", "image", "both", "multimodal"],
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        default=config["vectordb"]["profile"],
+        help="Collection profile with the index and storage settings",
+        choices=list(config["vectordb"]["profiles"]),
     )
 
     args = parser.parse_args()
+    qdrant_manager.profile = CollectionProfile.from_config(args.profile)
 
     # Create the collections for audio
     if args.collection == "audio" or args.collection == "both":
@@ -30,3 +41,7 @@ if __name__ == "__main__":
             model=Model.CLIP,
             model_dim=MODEL_IMAGE_DIM,
         )
+
+    # Create the collection with named vectors for audio and images
+    if args.collection == "multimodal":
+        create_multimodal_collection(qdrant_manager=qdrant_manager)
@@ -0,0 +1,54 @@
+import argparse
+
+from configuration.load import config
+from rag.clients import qdrant_manager
+from rag.core import snapshot
+
+# Name of the collection of each choice of the command line
+COLLECTIONS = {
+    "audio": config["vectordb"]["collection_audio"],
+    "image": config["vectordb"]["collection_image"],
+    "multimodal": config["vectordb"]["collection_multimodal"],
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the points of a collection to a directory"
+    )
+    parser.add_argument(
+        "-c",
+        "--collection",
+        type=str,
+        required=True,
+        help="Select the collection to export",
+        choices=list(COLLECTIONS),
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=True,
+        help="Directory where the collection is exported",
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        default=config["snapshots"]["dtype"],
+        help="Precision of the exported vectors",
+        choices=list(snapshot.VECTOR_DTYPES),
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=config["snapshots"]["batch_size"],
+        help="Number of points read from Qdrant per request",
+    )
+
+    args = parser.parse_args()
+    qdrant_manager.export_collection(
+        collection_name=COLLECTIONS[args.collection],
+        directory=args.output,
+        dtype=args.dtype,
+        page_size=args.batch_size,
+    )
@@ -0,0 +1,73 @@
+import argparse
+
+from configuration.load import config
+from rag.clients import qdrant_manager
+from rag.core import snapshot
+from rag.core.profiles import CollectionProfile
+from rag.export_collection import COLLECTIONS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import a collection exported with rag.export_collection"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        required=True,
+        help="Directory of the exported collection",
+    )
+    parser.add_argument(
+        "-c",
+        "--collection",
+        type=str,
+        default=None,
+        help="Collection to import into, by default the exported one",
+        choices=list(COLLECTIONS),
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        default=config["vectordb"]["profile"],
+        help="Profile of the collection if it has to be created",
+        choices=list(config["vectordb"]["profiles"]),
+    )
+    parser.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Delete the collection before importing, if it exists",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=config["snapshots"]["batch_size"],
+        help="Number of points per upsert",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=config["snapshots"]["workers"],
+        help="Number of upserts sent to Qdrant at the same time",
+    )
+
+    args = parser.parse_args()
+    qdrant_manager.profile = CollectionProfile.from_config(args.profile)
+
+    if args.collection is not None:
+        collection_name = COLLECTIONS[args.collection]
+    else:
+        collection_name = snapshot.read_meta(args.input)["collection"]
+
+    # Start from an empty collection instead of merging the points
+    if args.recreate and qdrant_manager.check_collection(collection_name):
+        qdrant_manager.delete_collection(collection_name)
+
+    qdrant_manager.import_collection(
+        directory=args.input,
+        collection_name=collection_name,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+    )
@@ -1,11 +1,24 @@
-from typing import Generator, List
+from threading import Lock
+from typing import Callable, Dict, Generator, List, Optional, Tuple
 
 from qdrant_client.conversions import common_types as types
-from qdrant_client.http import models
 
+from configuration.load import config
+from rag.core.cache import EmbeddingCache
 from rag.core.data import DataToUpsert
-from rag.core.models import Model
-from rag.core.vectordb import QdrantWrapper
+from rag.core.logger import logger
+from rag.core.models import (
+    MODEL_AUDIO_DIM,
+    MODEL_IMAGE_DIM,
+    Modalities,
+    Model,
+    create_caption,
+    create_embeddings_from_inputs,
+)
+from rag.core.pipeline import IngestPipeline
+from rag.core.retrieval import HybridRetriever, RetrievalStage, ZeroShotLabeler
+from rag.core.sync import Manifest, plan_sync
+from rag.core.vectordb import AsyncQdrantWrapper, FilterValue, QdrantWrapper
 
 
 def create_collections(
@@ -16,11 +29,31 @@ def create_collections(
     if not qdrant_manager.check_collection(collection_name):
         qdrant_manager.create_collection(
             collection_name=collection_name,
-            vectors_config=models.VectorParams(
-                size=model_dim,
-                distance=models.Distance.COSINE,
+            vectors_config=qdrant_manager.profile.vectors_config(
+                size=model_dim
             ),
         )
+    else:
+        qdrant_manager.create_payload_indexes(collection_name)
+
+
+def create_multimodal_collection(qdrant_manager: QdrantWrapper):
+    """Create the collection that stores the audio and image embeddings of
+    every file as named vectors (clap, clip and clip_caption)."""
+    collection_name = config["vectordb"]["collection_multimodal"]
+    if not qdrant_manager.check_collection(collection_name):
+        model_dims = {Model.CLAP: MODEL_AUDIO_DIM, Model.CLIP: MODEL_IMAGE_DIM}
+        qdrant_manager.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                vector_name: qdrant_manager.profile.vectors_config(
+                    size=model_dims[model]
+                )
+                for vector_name, model in QdrantWrapper.vector_models.items()
+            },
+        )
+    else:
+        qdrant_manager.create_payload_indexes(collection_name)
 
 
 def upsert_full_data(
@@ -28,32 +61,266 @@ def upsert_full_data(
     collection_name: str,
     model_dim: int,
     data_to_upsert: Generator[DataToUpsert, None, None],
+    batch_size: int = config["ingest"]["batch_size"],
+    pipeline: Optional[IngestPipeline] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    window_seconds: Optional[float] = None,
+    hop_seconds: Optional[float] = None,
+    vector_name: Optional[str] = None,
+    caption_function: Optional[Callable[[List[str]], List[str]]] = None,
 ):
-    """Upsert all data to the specified collection."""
+    """Upsert all data to the specified collection. If a pipeline is given,
+    the data is decoded, embedded and uploaded in parallel stages. If
+    `window_seconds` is given, the audios are split in windows and each
+    window is upserted as a separate point. If `vector_name` is given, the
+    embeddings are stored as that named vector of the multimodal
+    collection. If `caption_function` is given, the caption of each file
+    is stored in its payload, and as the caption vector in the multimodal
+    collection."""
+    if window_seconds and caption_function is not None:
+        raise ValueError("Captions are not supported for segmented audios")
+
     # Check if the collection exists
-    if not qdrant_manager.check_collection(collection_name):
+    if vector_name is not None:
+        create_multimodal_collection(qdrant_manager)
+    elif not qdrant_manager.check_collection(collection_name):
         qdrant_manager.create_collection(
             collection_name=collection_name,
-            vectors_config=models.VectorParams(
-                size=model_dim, distance=models.Distance.COSINE
+            vectors_config=qdrant_manager.profile.vectors_config(
+                size=model_dim
             ),
         )
 
     # Upsert vectors to the collection
+    if window_seconds:
+        qdrant_manager.upsert_segments(
+            collection_name=collection_name,
+            data_to_upsert=data_to_upsert,
+            embedding_function=create_embeddings_from_inputs,
+            window_seconds=window_seconds,
+            hop_seconds=hop_seconds,
+            batch_size=batch_size,
+            embedding_cache=embedding_cache,
+            vector_name=vector_name,
+        )
+        return
+
+    if pipeline is not None:
+        pipeline.run(
+            collection_name=collection_name,
+            data_to_upsert=data_to_upsert,
+            vector_name=vector_name,
+            caption_function=caption_function,
+        )
+        return
+
     qdrant_manager.upsert_vectors(
         collection_name=collection_name,
         data_to_upsert=data_to_upsert,
+        batch_size=batch_size,
+        embedding_cache=embedding_cache,
+        vector_name=vector_name,
+        caption_function=caption_function,
+    )
+
+
+def sync_full_data(
+    qdrant_manager: QdrantWrapper,
+    collection_name: str,
+    model_dim: int,
+    directory: str,
+    file_extension: str,
+    payload_generator: Callable[[str], Dict[str, str]],
+    manifest: Manifest,
+    batch_size: int = config["ingest"]["batch_size"],
+    pipeline: Optional[IngestPipeline] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    caption_function: Optional[Callable[[List[str]], List[str]]] = None,
+):
+    """Sync the specified collection with the files in the directory: only
+    new or changed files are upserted, and captioned if `caption_function`
+    is given, and the points of removed files are deleted."""
+    existing_points = {}
+    if qdrant_manager.check_collection(collection_name):
+        existing_points = qdrant_manager.get_point_filenames(collection_name)
+
+    plan = plan_sync(
+        directory=directory,
+        file_extension=file_extension,
+        payload_generator=payload_generator,
+        manifest_entries=manifest.entries(collection_name),
+        existing_points=existing_points,
+    )
+    logger.info(
+        f"Sync {collection_name}: {len(plan.to_upsert)} points to upsert, "
+        f"{len(plan.to_delete)} points to delete"
     )
 
+    if plan.to_upsert:
+        upsert_full_data(
+            qdrant_manager=qdrant_manager,
+            collection_name=collection_name,
+            model_dim=model_dim,
+            data_to_upsert=plan.to_upsert,
+            batch_size=batch_size,
+            pipeline=pipeline,
+            embedding_cache=embedding_cache,
+            caption_function=caption_function,
+        )
+    qdrant_manager.delete_vectors(collection_name, plan.to_delete)
+    manifest.update(collection_name, plan.entries)
+
 
 def search_similar_items(
     qdrant_manager: QdrantWrapper,
     collection_name: str,
     value: str,
+    filters: Optional[Dict[str, FilterValue]] = None,
 ) -> List[types.ScoredPoint]:
-    """Search audio by text."""
+    """Search audio by text, optionally filtering by payload fields."""
     search_results = qdrant_manager.search_vectors(
-        collection_name=collection_name, value=value
+        collection_name=collection_name, value=value, filters=filters
     )
 
     return search_results
+
+
+def search_similar_items_batch(
+    qdrant_manager: QdrantWrapper,
+    collection_name: str,
+    values: List[str],
+    filters: Optional[Dict[str, FilterValue]] = None,
+) -> List[List[types.ScoredPoint]]:
+    """Search for several values with one forward pass and one request to
+    Qdrant, returning the results in the same order as the values."""
+    return qdrant_manager.search_vectors_batch(
+        collection_name=collection_name, values=values, filters=filters
+    )
+
+
+def search_similar_items_multimodal(
+    qdrant_manager: QdrantWrapper,
+    value: str,
+    vector_names: List[str],
+    filters: Optional[Dict[str, FilterValue]] = None,
+) -> Dict[str, List[types.ScoredPoint]]:
+    """Search several named vectors of the multimodal collection in a
+    single request, returning the results by vector name."""
+    return qdrant_manager.search_named_vectors(
+        collection_name=config["vectordb"]["collection_multimodal"],
+        value=value,
+        vector_names=vector_names,
+        filters=filters,
+    )
+
+
+def search_cross_modal(
+    qdrant_manager: QdrantWrapper,
+    retriever: HybridRetriever,
+    labeler: ZeroShotLabeler,
+    modality: Modalities,
+    path: str,
+    top: int = 5,
+    filters: Optional[Dict[str, FilterValue]] = None,
+) -> List[types.ScoredPoint]:
+    """Search images for an audio or audios for an image. The stages run in
+    parallel and their rankings are fused: the file is labeled zero-shot
+    with its own model and the label is searched as text, and the file is
+    captioned and the caption is searched as text. If
+    `retrieval.caption_vectors` is enabled, the label is also searched in
+    the caption vectors precomputed at ingest in the multimodal
+    collection. If `retrieval.rescore` is enabled, the fused points are
+    scored again against the texts searched by the stages that
+    finished."""
+    if modality == Modalities.AUDIO:
+        source_model, target_model = Model.CLAP, Model.CLIP
+        target_type = "image"
+    elif modality == Modalities.IMAGE:
+        source_model, target_model = Model.CLIP, Model.CLAP
+        target_type = "sound"
+    else:
+        raise ValueError(f"Unsupported modality: {modality}")
+    collection_name = QdrantWrapper.model_collections[target_model]
+
+    # The label is shared by the stages that need it, computed once
+    label_lock, labels = Lock(), []
+
+    def get_label() -> str:
+        with label_lock:
+            if not labels:
+                labels.append(labeler.label(model=source_model, path=path))
+            return labels[0]
+
+    def search_label() -> List[types.ScoredPoint]:
+        return qdrant_manager.search_vectors(
+            collection_name=collection_name,
+            value=labeler.prompt(target_model, get_label()),
+            top=top,
+            filters=filters,
+        )
+
+    def search_caption_vectors() -> List[types.ScoredPoint]:
+        caption_vector = QdrantWrapper.caption_vector
+        return qdrant_manager.search_named_vectors(
+            collection_name=config["vectordb"]["collection_multimodal"],
+            value=labeler.prompt(
+                QdrantWrapper.vector_models[caption_vector], get_label()
+            ),
+            vector_names=[caption_vector],
+            top=top,
+            filters={**(filters or {}), "type": target_type},
+        )[caption_vector]
+
+    # Caption of the file, kept for the rescoring if its stage finishes
+    captions = []
+
+    def search_caption() -> List[types.ScoredPoint]:
+        caption = create_caption(modality=modality, path=path)
+        results = qdrant_manager.search_vectors(
+            collection_name=collection_name,
+            value=caption,
+            top=top,
+            filters=filters,
+        )
+        captions.append(caption)
+        return results
+
+    def rescore(points: List[types.ScoredPoint]) -> List[types.ScoredPoint]:
+        # Only the texts whose stage finished in time are used
+        values = list(captions)
+        if labels:
+            values.append(labeler.prompt(target_model, labels[0]))
+        return qdrant_manager.rescore_points(
+            collection_name=collection_name, points=points, values=values
+        )
+
+    budgets = config["retrieval"]["budgets_ms"]
+    stages = [
+        RetrievalStage("label", search_label, budgets["label"]),
+        RetrievalStage("caption", search_caption, budgets["caption"]),
+    ]
+    if config["retrieval"]["caption_vectors"]:
+        stages.append(
+            RetrievalStage(
+                "caption_vectors",
+                search_caption_vectors,
+                budgets["caption_vectors"],
+            )
+        )
+    return retriever.search(
+        stages=stages,
+        top=top,
+        rescore=rescore if config["retrieval"]["rescore"] else None,
+    )
+
+
+def search_similar_items_many(
+    async_qdrant_manager: AsyncQdrantWrapper,
+    queries: List[Tuple[str, str]],
+    filters: Optional[Dict[str, FilterValue]] = None,
+) -> List[List[types.ScoredPoint]]:
+    """Search several collections concurrently, given (collection name,
+    value) pairs."""
+    return async_qdrant_manager.run(
+        async_qdrant_manager.search_many(queries=queries, filters=filters)
+    )
@@ -1,28 +1,174 @@
 import argparse
+import json
+import sys
+from typing import Dict, Generator, List, Optional, TextIO
 
-from rag import search_similar_items
+from configuration.load import config
+from rag import (
+    search_similar_items,
+    search_similar_items_batch,
+    search_similar_items_multimodal,
+)
 from rag.clients import qdrant_manager
+from rag.core.data import batched
+from rag.core.metrics import metrics
 from rag.core.models import Model
 
+
+def parse_filters(filters: Optional[List[str]]) -> Dict[str, str]:
+    """Parse filters given as key=value pairs."""
+    parsed = {}
+    for item in filters or []:
+        key, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid filter {item}, expected key=value")
+        parsed[key] = value
+    return parsed
+
+
+def read_jsonl(file: TextIO) -> Generator[dict, None, None]:
+    """Read the records of a JSONL file one at a time."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def search_jsonl(
+    input_file: TextIO,
+    output_file: TextIO,
+    collection_name: str,
+    field: str,
+    batch_size: int,
+    filters: Optional[Dict[str, str]] = None,
+) -> int:
+    """Search the `field` of each record of a JSONL file and write each
+    record with its results as JSONL. The records are streamed in batches
+    searched with a single request, so memory stays bounded. Return the
+    number of records searched."""
+    count = 0
+    for records in batched(read_jsonl(input_file), batch_size):
+        search_results = search_similar_items_batch(
+            qdrant_manager=qdrant_manager,
+            collection_name=collection_name,
+            values=[record[field] for record in records],
+            filters=filters,
+        )
+        for record, results in zip(records, search_results):
+            record["results"] = [
+                {
+                    "id": str(result.id),
+                    "score": result.score,
+                    "payload": result.payload,
+                }
+                for result in results
+            ]
+            output_file.write(json.dumps(record) + "\n")
+        count += len(records)
+    return count
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Search for similar audios or images"
     )
-    parser.add_argument(
+    queries = parser.add_mutually_exclusive_group(required=True)
+    queries.add_argument(
         "-v", "--value", type=str, help="Text query to search for"
     )
+    queries.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        help="JSONL file with one query per line to search in batches",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="-",
+        help="JSONL file for the results of --input, stdout by default",
+    )
+    parser.add_argument(
+        "--field",
+        type=str,
+        default="value",
+        help="Field of the --input records with the query",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=config["ingest"]["batch_size"],
+        help="Number of --input queries searched per request",
+    )
     parser.add_argument(
         "-m",
         "--model",
         type=str,
         help="Specify model: CLIP or CLAP",
     )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        type=str,
+        action="append",
+        help="Restrict the search to a payload value, e.g. category=dog",
+    )
+    parser.add_argument(
+        "--vectors",
+        type=str,
+        nargs="+",
+        choices=list(qdrant_manager.vector_models),
+        help="Search these named vectors of the multimodal collection",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        help="Write the timings and counters to this file (.prom or .json)",
+    )
 
     args = parser.parse_args()
-    search_results = search_similar_items(
-        qdrant_manager=qdrant_manager,
-        collection_name=qdrant_manager.model_collections[
-            Model.CLAP if args.model.upper() == "CLAP" else Model.CLIP
-        ],
-        value=args.value,
-    )
+    if args.input:
+        model = Model.CLAP if args.model.upper() == "CLAP" else Model.CLIP
+        output_file = (
+            sys.stdout if args.output == "-" else open(args.output, "w")
+        )
+        with open(args.input) as input_file:
+            search_jsonl(
+                input_file=input_file,
+                output_file=output_file,
+                collection_name=qdrant_manager.model_collections[model],
+                field=args.field,
+                batch_size=args.batch_size,
+                filters=parse_filters(args.filter),
+            )
+        if output_file is not sys.stdout:
+            output_file.close()
+        results_by_vector = {}
+    elif args.vectors:
+        results_by_vector = search_similar_items_multimodal(
+            qdrant_manager=qdrant_manager,
+            value=args.value,
+            vector_names=args.vectors,
+            filters=parse_filters(args.filter),
+        )
+    else:
+        model = Model.CLAP if args.model.upper() == "CLAP" else Model.CLIP
+        results_by_vector = {
+            model.value: search_similar_items(
+                qdrant_manager=qdrant_manager,
+                collection_name=qdrant_manager.model_collections[model],
+                value=args.value,
+                filters=parse_filters(args.filter),
+            )
+        }
+
+    for vector_name, search_results in results_by_vector.items():
+        if len(results_by_vector) > 1:
+            print(vector_name)
+        for result in search_results:
+            print(f"{result.score:.4f} {result.payload}")
+
+    if args.metrics:
+        metrics.write(args.metrics)
@@ -1,19 +1,73 @@
 import argparse
+from functools import partial
+from typing import Optional
 
 from configuration.load import config
-from rag import upsert_full_data
+from rag import sync_full_data, upsert_full_data
 from rag.clients import qdrant_manager
+from rag.core.cache import EmbeddingCache
 from rag.core.data import (
     audio_payload_generator,
     create_data_to_upsert,
     image_payload_generator,
 )
-from rag.core.models import MODEL_AUDIO_DIM, MODEL_IMAGE_DIM
+from rag.core.metrics import metrics
+from rag.core.models import (
+    MODEL_AUDIO_DIM,
+    MODEL_IMAGE_DIM,
+    Modalities,
+    create_captions,
+    create_embeddings_from_inputs,
+)
+from rag.core.pipeline import IngestPipeline
+from rag.core.sync import Manifest
+
 
+def upsert_embeddings(
+    media_info: dict,
+    batch_size: int,
+    num_workers: int,
+    queue_size: int,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    manifest: Optional[Manifest] = None,
+    captions: bool = False,
+):
+    """Upsert embeddings to the vectordb. With `num_workers` greater than
+    zero, the files are processed by the staged ingest pipeline. If a
+    manifest is given, only the changes since the last sync are applied.
+    If `captions` is True, the files are also captioned."""
+    pipeline = None
+    if num_workers > 0:
+        pipeline = IngestPipeline(
+            qdrant_manager=qdrant_manager,
+            embedding_function=create_embeddings_from_inputs,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            queue_size=queue_size,
+            embedding_cache=embedding_cache,
+        )
 
-def upsert_embeddings(media_info: dict):
-    """Upsert embeddings to the vectordb."""
     for info in media_info:
+        caption_function = None
+        if captions:
+            caption_function = partial(create_captions, info["modality"])
+
+        if manifest is not None:
+            sync_full_data(
+                qdrant_manager=qdrant_manager,
+                collection_name=info["collection_name"],
+                model_dim=info["model_dim"],
+                directory=info["directory"],
+                file_extension=info["file_extension"],
+                payload_generator=info["payload_generator"],
+                manifest=manifest,
+                batch_size=batch_size,
+                pipeline=pipeline,
+                embedding_cache=embedding_cache,
+                caption_function=caption_function,
+            )
+            continue
+
         upsert_full_data(
             qdrant_manager=qdrant_manager,
             collection_name=info["collection_name"],
@@ -23,6 +77,13 @@ def upsert_embeddings(media_info: dict):
                 file_extension=info["file_extension"],
                 payload_generator=info["payload_generator"],
             ),
+            batch_size=batch_size,
+            pipeline=pipeline,
+            embedding_cache=embedding_cache,
+            window_seconds=info.get("window_seconds"),
+            hop_seconds=info.get("hop_seconds"),
+            vector_name=info.get("vector_name"),
+            caption_function=caption_function,
         )
 
 
@@ -32,11 +93,73 @@ if __name__ == "__main__":
         "-c",
         "--collection",
         type=str,
-        help="Select the collection to upsert: audio or image",
-        choices=["audio", "image", "both"],
+        help="Select the collection to upsert: audio, image or multimodal",
+        choices=["audio", "image", "both", "multimodal"],
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=config["ingest"]["batch_size"],
+        help="Number of files embedded and upserted per request",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=config["ingest"]["workers"],
+        help="Processes decoding the files, 0 to run in a single thread",
+    )
+    parser.add_argument(
+        "-q",
+        "--queue-size",
+        type=int,
+        default=config["ingest"]["queue_size"],
+        help="Maximum number of batches waiting between pipeline stages",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute all the embeddings instead of using the cache",
+    )
+    parser.add_argument(
+        "-s",
+        "--sync",
+        action="store_true",
+        help="Only upsert new or changed files and delete removed ones",
+    )
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=config["ingest"]["segment_seconds"],
+        help="Split the audios in windows of this length, 0 to disable",
+    )
+    parser.add_argument(
+        "--segment-hop",
+        type=float,
+        default=None,
+        help="Seconds between the start of consecutive windows",
+    )
+    parser.add_argument(
+        "--captions",
+        action=argparse.BooleanOptionalAction,
+        default=config["ingest"]["captions"],
+        help="Caption the files and store the captions with the vectors",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        help="Write the timings and counters to this file (.prom or .json)",
     )
 
     args = parser.parse_args()
+    if args.sync and args.segment_seconds:
+        parser.error("--sync does not support segmented audios")
+    if args.sync and args.collection == "multimodal":
+        parser.error("--sync does not support the multimodal collection")
+    if args.captions and args.segment_seconds:
+        parser.error("--captions does not support segmented audios")
 
     # Config for audios
     audio_config = {
@@ -45,6 +168,9 @@ if __name__ == "__main__":
         "directory": config["local"]["audios"],
         "file_extension": config["local"]["audio_file_extension"],
         "payload_generator": audio_payload_generator,
+        "modality": Modalities.AUDIO,
+        "window_seconds": args.segment_seconds,
+        "hop_seconds": args.segment_hop,
     }
 
     # Config for images
@@ -54,14 +180,44 @@ if __name__ == "__main__":
         "directory": config["local"]["images"],
         "file_extension": config["local"]["image_file_extension"],
         "payload_generator": image_payload_generator,
+        "modality": Modalities.IMAGE,
     }
 
     # Create and upload the audio embedding to qdrant
-    if args.collection == "audio" or args.collection == "both":
+    if args.collection == "audio":
         media_info = [audio_config]
-    elif args.collection == "image" or args.collection == "both":
+    elif args.collection == "image":
         media_info = [image_config]
+    elif args.collection == "multimodal":
+        # Audios and images are stored in the same collection, each one
+        # with the named vector of its model
+        media_info = [
+            {
+                **audio_config,
+                "collection_name": config["vectordb"]["collection_multimodal"],
+                "vector_name": "clap",
+            },
+            {
+                **image_config,
+                "collection_name": config["vectordb"]["collection_multimodal"],
+                "vector_name": "clip",
+            },
+        ]
     else:
         media_info = [audio_config, image_config]
 
-    upsert_embeddings(media_info)
+    embedding_cache = None
+    if not args.no_cache:
+        embedding_cache = EmbeddingCache(config["ingest"]["embeddings_cache"])
+
+    upsert_embeddings(
+        media_info,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        queue_size=args.queue_size,
+        embedding_cache=embedding_cache,
+        manifest=Manifest(config["ingest"]["manifest"]) if args.sync else None,
+        captions=args.captions,
+    )
+    if args.metrics:
+        metrics.write(args.metrics)
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from data import download  # noqa: E402
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """S3 client of a mocked bucket with the configured name."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=download.BUCKET)
+        yield client
+
+
+def put_audio(s3, name: str, body: bytes) -> dict:
+    """Upload an audio and return its entry of the listing."""
+    key = f"{download.S3_PATH}{name}"
+    s3.put_object(Bucket=download.BUCKET, Key=key, Body=body)
+    head = s3.head_object(Bucket=download.BUCKET, Key=key)
+    return {"Key": key, "Size": len(body), "ETag": head["ETag"]}
+
+
+def start_part(path: str, body: bytes, etag: str) -> None:
+    """Leave a partial download of the given data and ETag."""
+    with open(f"{path}.part", "wb") as file:
+        file.write(body)
+    with open(f"{path}.part.etag", "w") as file:
+        file.write(etag)
+
+
+def test_downloads_every_page_and_skips_present_files(
+    s3, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(download, "LOCAL_PATH_AUDIOS", str(tmp_path))
+    for i in range(1001):
+        s3.put_object(
+            Bucket=download.BUCKET,
+            Key=f"{download.S3_PATH}dog_{i}.wav",
+            Body=str(i).encode(),
+        )
+
+    statuses = download.download_audios_from_s3(s3=s3, num_workers=4)
+    assert statuses == {"downloaded": 1001}
+    assert (tmp_path / "dog_1000.wav").read_bytes() == b"1000"
+
+    statuses = download.download_audios_from_s3(
+        s3=s3, num_workers=4, verify_etag=True
+    )
+    assert statuses == {"skipped": 1001}
+
+
+def test_resumes_partial_download(s3, tmp_path):
+    body = os.urandom(1000)
+    content = put_audio(s3, "dog.wav", body)
+    path = str(tmp_path / "dog.wav")
+    start_part(path, body[:400], content["ETag"])
+
+    status = download.download_object(s3, content, str(tmp_path))
+
+    assert status == "resumed"
+    assert (tmp_path / "dog.wav").read_bytes() == body
+    assert sorted(os.listdir(tmp_path)) == ["dog.wav"]
+
+
+def test_restarts_if_object_changed_during_download(s3, tmp_path):
+    old_body, new_body = os.urandom(1000), os.urandom(1000)
+    old_content = put_audio(s3, "dog.wav", old_body)
+    path = str(tmp_path / "dog.wav")
+    start_part(path, old_body[:400], old_content["ETag"])
+    # The object changes after being listed, while it is downloaded
+    put_audio(s3, "dog.wav", new_body)
+
+    status = download.download_object(s3, old_content, str(tmp_path))
+
+    assert status == "downloaded"
+    assert (tmp_path / "dog.wav").read_bytes() == new_body
+
+
+def test_discards_part_of_another_version(s3, tmp_path):
+    old_body, new_body = os.urandom(1000), os.urandom(1000)
+    old_content = put_audio(s3, "dog.wav", old_body)
+    new_content = put_audio(s3, "dog.wav", new_body)
+    path = str(tmp_path / "dog.wav")
+
+    # Complete, but of the old version of the object
+    start_part(path, old_body, old_content["ETag"])
+    status = download.download_object(s3, new_content, str(tmp_path))
+    assert status == "downloaded"
+    assert (tmp_path / "dog.wav").read_bytes() == new_body
+
+    # Without the ETag it was started from
+    os.remove(path)
+    with open(f"{path}.part", "wb") as file:
+        file.write(old_body[:400])
+    status = download.download_object(s3, new_content, str(tmp_path))
+    assert status == "downloaded"
+    assert (tmp_path / "dog.wav").read_bytes() == new_body